@@ -1,16 +1,26 @@
+import asyncio
 import json
 import os
-from typing import Dict, List, Any
+import uuid
+from typing import Dict, List, Any, AsyncIterator, Literal, Optional
+from pydantic import BaseModel, Field
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
+from langchain_core.runnables import RunnableConfig
 from langgraph.prebuilt import create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
 from langchain_core.callbacks import BaseCallbackHandler
 
 # Database imports
-from database import SessionLocal
+from sqlalchemy import select, update
+from database import AsyncSessionLocal
+from unit_of_work import TurnUnitOfWork, TurnConflict, run_tool, UOW_CONFIG_KEY
 from models import Producto, User as UserModel, CategoriaEnum
+from intent_router import IntentRouter, INTENT_ROUTER_ENABLED
+from memory import BoundedMemorySaver, trim_history, compact_context, fold_context, diff_context, with_context
+from search import product_index, mark_products_changed, SEARCH_DEFAULT_LIMIT
+from change_feed import record_change
+from outbound import outbound
 
 # Callback to capture actions separately from text response
 class ActionCaptureCallback(BaseCallbackHandler):
@@ -27,6 +37,102 @@ class ActionCaptureCallback(BaseCallbackHandler):
         except Exception:
             pass
 
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose requests go through the shared outbound limiter (rate, concurrency, 429 backoff)."""
+
+    async def _agenerate(self, *args, **kwargs):
+        async with outbound["openai_chat"].slot():
+            return await super()._agenerate(*args, **kwargs)
+
+    async def _astream(self, *args, **kwargs):
+        async with outbound["openai_chat"].slot():
+            async for chunk in super()._astream(*args, **kwargs):
+                yield chunk
+
+class OperacionProducto(BaseModel):
+    """One item of a batch voice command."""
+    tipo: Literal["crear", "actualizar", "eliminar", "ajustar_stock"]
+    producto_id: Optional[int] = Field(None, description="ID del producto (actualizar, eliminar, ajustar_stock)")
+    nombre: Optional[str] = None
+    categoria: Optional[str] = Field(None, description="alimentacion, juguetes, accesorios, salud, higiene, otros")
+    ubicacion: Optional[str] = None
+    cantidad: Optional[int] = Field(None, description="Stock inicial (crear) o nuevo stock absoluto (actualizar)")
+    descripcion: Optional[str] = None
+    delta: Optional[int] = Field(None, description="Unidades a sumar (positivo) o restar (negativo) en ajustar_stock")
+
+def _categoria(value: str) -> CategoriaEnum:
+    try:
+        return CategoriaEnum(value.lower())
+    except (ValueError, AttributeError):
+        return CategoriaEnum.OTROS
+
+async def _adjust_stock(db, producto_id: int, delta: int) -> Dict:
+    """
+    Atomic relative stock change: a single UPDATE ... SET cantidad = cantidad + :delta,
+    so concurrent edits never overwrite each other. Never lets stock go below zero.
+    """
+    row = (await db.execute(
+        update(Producto)
+        .where(Producto.id == producto_id, Producto.cantidad + delta >= 0)
+        .values(cantidad=Producto.cantidad + delta)
+        .returning(Producto.nombre, Producto.cantidad)
+        .execution_options(synchronize_session=False)
+    )).first()
+    # Core UPDATE: flag it for the search index's commit hook by hand
+    mark_products_changed(db.sync_session, [producto_id])
+    if row is None:
+        producto = await db.get(Producto, producto_id)
+        if not producto:
+            raise ValueError(f"Producto {producto_id} no encontrado")
+        raise ValueError(f"Stock insuficiente de {producto.nombre}: hay {producto.cantidad}, se piden {-delta}")
+    record_change(db.sync_session, "updated", producto_id, {"cantidad": row.cantidad})
+    return {"product_id": producto_id, "nombre": row.nombre, "cantidad": row.cantidad}
+
+async def _apply_operation(db, op: OperacionProducto) -> Dict:
+    if op.tipo == "crear":
+        if not (op.nombre and op.ubicacion):
+            raise ValueError("crear necesita nombre y ubicacion")
+        producto = Producto(
+            nombre=op.nombre,
+            descripcion=op.descripcion or "",
+            categoria=_categoria(op.categoria),
+            ubicacion=op.ubicacion,
+            cantidad=op.cantidad if op.cantidad is not None else 1,
+            registrado_por=1  # Usuario del sistema por voz
+        )
+        db.add(producto)
+        await db.flush()
+        return {"tipo": "crear", "product_id": producto.id, "nombre": producto.nombre}
+
+    if op.producto_id is None:
+        raise ValueError(f"{op.tipo} necesita producto_id")
+
+    if op.tipo == "ajustar_stock":
+        if not op.delta:
+            raise ValueError("ajustar_stock necesita un delta distinto de cero")
+        return {"tipo": "ajustar_stock", **await _adjust_stock(db, op.producto_id, op.delta)}
+
+    producto = await db.get(Producto, op.producto_id)
+    if not producto:
+        raise ValueError(f"Producto {op.producto_id} no encontrado")
+
+    # Flushed right away: a later ajustar_stock on the same id is a Core UPDATE
+    # and must see this change (and must not be overwritten by it at commit)
+    if op.tipo == "eliminar":
+        await db.delete(producto)
+        await db.flush()
+        return {"tipo": "eliminar", "product_id": op.producto_id, "nombre": producto.nombre}
+
+    changes = op.model_dump(include={"nombre", "ubicacion", "cantidad", "descripcion"}, exclude_none=True)
+    if op.categoria:
+        changes["categoria"] = _categoria(op.categoria)
+    if not changes:
+        raise ValueError("actualizar necesita al menos un campo")
+    for field, value in changes.items():
+        setattr(producto, field, value)
+    await db.flush()
+    return {"tipo": "actualizar", "product_id": op.producto_id, "campos": sorted(changes)}
+
 class InteractionAgent:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
@@ -34,8 +140,10 @@ class InteractionAgent:
             print("WARNING: No OPENAI_API_KEY found. Agent will not work.")
             return
 
-        self.llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=self.api_key)
-        self.memory = MemorySaver()
+        # stream_usage: token counts are reported for streamed answers too
+        self.llm = ScheduledChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=self.api_key, stream_usage=True)
+        self.usage_totals = {"turns": 0, "llm_calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        self.memory = BoundedMemorySaver()
         
         # --- DEFINING TOOLS ---
         
@@ -66,12 +174,13 @@ class InteractionAgent:
         # ===== PRODUCTOS CRUD TOOLS =====
         
         @tool
-        def crear_producto(
+        async def crear_producto(
             nombre: str, 
             categoria: str, 
             ubicacion: str, 
             cantidad: int = 1,
-            descripcion: str = ""
+            descripcion: str = "",
+            config: RunnableConfig = None
         ):
             """
             Crea un nuevo producto en la base de datos de la tienda.
@@ -82,57 +191,50 @@ class InteractionAgent:
                 cantidad: Cantidad de stock (por defecto 1)
                 descripcion: Descripción opcional del producto
             """
-            try:
-                db = SessionLocal()
-                # Validar categoría
-                try:
-                    categoria_enum = CategoriaEnum(categoria.lower())
-                except ValueError:
-                    # Intento de corrección o default a OTROS si falla
-                    categoria_enum = CategoriaEnum.OTROS
-                
+            async def work(db):
                 new_producto = Producto(
                     nombre=nombre,
                     descripcion=descripcion,
-                    categoria=categoria_enum,
+                    # Categoría inválida -> OTROS
+                    categoria=_categoria(categoria),
                     ubicacion=ubicacion,
                     cantidad=cantidad,
                     registrado_por=1  # Usuario del sistema por voz
                 )
                 
                 db.add(new_producto)
-                db.commit()
-                db.refresh(new_producto)
+                # Flush for the id; the turn commits its writes when it ends
+                await db.flush()
                 
                 return json.dumps({
                     "action": "producto_created",
                     "product_id": new_producto.id,
                     "nombre": nombre
                 })
+
+            try:
+                return await run_tool(config, work)
             except Exception as e:
                 return json.dumps({"action": "error", "message": str(e)})
-            finally:
-                db.close()
         
         @tool
-        def listar_productos(categoria: str = ""):
+        async def listar_productos(categoria: str = "", config: RunnableConfig = None):
             """
             Lista los productos, opcionalmente filtrados por categoría.
             Args:
                 categoria: Categoría para filtrar (alimentacion, juguetes, etc.)
             """
-            try:
-                db = SessionLocal()
-                query = db.query(Producto)
+            async def work(db):
+                query = select(Producto)
                 
                 if categoria:
                     try:
                         categoria_enum = CategoriaEnum(categoria.lower())
-                        query = query.filter(Producto.categoria == categoria_enum)
+                        query = query.where(Producto.categoria == categoria_enum)
                     except ValueError:
                         pass # Ignorar filtro si es inválido
                 
-                productos = query.limit(10).all()
+                productos = (await db.execute(query.limit(10))).scalars().all()
                 
                 result = {
                     "action": "products_listed",
@@ -150,13 +252,38 @@ class InteractionAgent:
                 }
                 
                 return json.dumps(result)
+
+            try:
+                return await run_tool(config, work)
             except Exception as e:
                 return json.dumps({"action": "error", "message": str(e)})
-            finally:
-                db.close()
         
         @tool
-        def actualizar_producto(producto_id: int, campo: str, nuevo_valor: str):
+        async def buscar_productos(consulta: str, limite: int = SEARCH_DEFAULT_LIMIT):
+            """
+            Busca productos por nombre (o ubicación/descripción) y devuelve sus IDs ordenados por relevancia.
+            Tolera acentos y errores de transcripción. Úsalo para resolver el producto que el usuario nombra.
+            Args:
+                consulta: Lo que dijo el usuario (ej: "pienso Royal Canin")
+                limite: Número máximo de resultados (por defecto 5)
+            """
+            try:
+                # Own short read session: the index only holds committed rows, so products
+                # created earlier in this turn are found once the turn commits
+                async with AsyncSessionLocal() as db:
+                    await product_index.refresh(db)
+                productos = product_index.search(consulta, limite)
+                return json.dumps({
+                    "action": "products_found",
+                    "query": consulta,
+                    "count": len(productos),
+                    "products": productos
+                })
+            except Exception as e:
+                return json.dumps({"action": "error", "message": str(e)})
+
+        @tool
+        async def actualizar_producto(producto_id: int, campo: str, nuevo_valor: str, config: RunnableConfig = None):
             """
             Actualiza un campo de un producto.
             Args:
@@ -164,9 +291,8 @@ class InteractionAgent:
                 campo: Campo a modificar (nombre, ubicacion, cantidad, categoria)
                 nuevo_valor: Nuevo valor para el campo
             """
-            try:
-                db = SessionLocal()
-                producto = db.query(Producto).filter(Producto.id == producto_id).first()
+            async def work(db):
+                producto = await db.get(Producto, producto_id)
                 
                 if not producto:
                     return json.dumps({"action": "error", "message": "Producto no encontrado"})
@@ -178,46 +304,92 @@ class InteractionAgent:
                 elif campo in ["nombre", "ubicacion", "descripcion"]:
                     setattr(producto, campo, nuevo_valor)
                 
-                db.commit()
                 
                 return json.dumps({
                     "action": "product_updated",
                     "product_id": producto_id,
                     "campo": campo
                 })
+
+            try:
+                return await run_tool(config, work)
             except Exception as e:
                 return json.dumps({"action": "error", "message": str(e)})
-            finally:
-                db.close()
         
         @tool
-        def eliminar_producto(producto_id: int):
+        async def eliminar_producto(producto_id: int, config: RunnableConfig = None):
             """
             Elimina un producto de la base de datos.
             Args:
                 producto_id: ID del producto a eliminar
             """
-            try:
-                db = SessionLocal()
-                producto = db.query(Producto).filter(Producto.id == producto_id).first()
+            async def work(db):
+                producto = await db.get(Producto, producto_id)
                 
                 if not producto:
                     return json.dumps({"action": "error", "message": "Producto no encontrado"})
                 
                 nombre = producto.nombre
-                db.delete(producto)
-                db.commit()
+                await db.delete(producto)
                 
                 return json.dumps({
                     "action": "product_deleted",
                     "product_id": producto_id,
                     "nombre": nombre
                 })
+
+            try:
+                return await run_tool(config, work)
             except Exception as e:
                 return json.dumps({"action": "error", "message": str(e)})
-            finally:
-                db.close()
             
+        @tool
+        async def ajustar_stock(producto_id: int, delta: int, config: RunnableConfig = None):
+            """
+            Suma o resta unidades al stock de un producto de forma atómica.
+            Úsalo para entradas y salidas ("han llegado 5", "vendí 2") en lugar de actualizar_producto.
+            Args:
+                producto_id: ID del producto
+                delta: Unidades a sumar (positivo) o restar (negativo)
+            """
+            async def work(db):
+                result = await _adjust_stock(db, producto_id, delta)
+                return json.dumps({"action": "stock_adjusted", "delta": delta, **result})
+
+            try:
+                return await run_tool(config, work)
+            except Exception as e:
+                return json.dumps({"action": "error", "message": str(e)})
+
+        @tool
+        async def operaciones_lote(operaciones: List[OperacionProducto], config: RunnableConfig = None):
+            """
+            Aplica varias operaciones de inventario en una sola transacción (todas o ninguna).
+            Úsalo cuando el usuario dicte varios productos o cambios en una misma frase,
+            p. ej. "añade tres collares, dos champús y cinco pelotas en la estantería B2".
+            Args:
+                operaciones: Lista de operaciones (tipo: crear, actualizar, eliminar o ajustar_stock)
+            """
+            index = 0
+
+            async def work(db):
+                nonlocal index
+                results = []
+                for index, op in enumerate(operaciones):
+                    if isinstance(op, dict):
+                        op = OperacionProducto(**op)
+                    results.append(await _apply_operation(db, op))
+                return json.dumps({"action": "batch_applied", "count": len(results), "results": results})
+
+            try:
+                return await run_tool(config, work)
+            except Exception as e:
+                # The tool call's transaction rolled back: none of its changes remain
+                return json.dumps({
+                    "action": "error",
+                    "message": f"Operación {index + 1}: {e}. No se aplicó ningún cambio."
+                })
+
         @tool
         def abrir_formulario_producto():
             """
@@ -266,13 +438,20 @@ class InteractionAgent:
             submit_form,
             crear_producto,
             listar_productos,
+            buscar_productos,
             actualizar_producto,
             eliminar_producto,
+            ajustar_stock,
+            operaciones_lote,
             abrir_formulario_producto,
             cerrar_formulario_producto,
             login_user,
             logout_user
         ]
+        self.tools_by_name = {t.name: t for t in self.tools}
+
+        # Simple commands skip the LLM entirely
+        self.intent_router = IntentRouter() if INTENT_ROUTER_ENABLED else None
         
         self.system_prompt = """Eres un asistente de voz experto para la gestión de una Tienda de Mascotas (Pet Shop).
 
@@ -285,6 +464,9 @@ CAPACIDADES:
 2. Gestión de Datos (Persistencia):
    - `crear_producto`: Úsalo SOLO cuando tengas TODOS los datos necesarios y el usuario confirme guardar.
    - `listar_productos`, `actualizar_producto`, `eliminar_producto`: Para gestionar el inventario existente.
+   - `ajustar_stock`: Para entradas y salidas de stock ("han llegado 5", "he vendido 2"); suma o resta sin leer antes la cantidad.
+   - `operaciones_lote`: Si el usuario dicta varios productos o cambios a la vez, agrúpalos en UNA sola llamada (se aplican todos o ninguno).
+   - `buscar_productos`: Cuando el usuario nombre un producto (ej: "el pienso Royal Canin"), búscalo para obtener su ID en una sola llamada; no listes todo el inventario. Si hay varios resultados con puntuación parecida, pregunta cuál.
 
 3. Gestión de Sesión:
    - `login_user`: Si el usuario pide entrar o loguearse (ej: "entrar como admin").
@@ -307,13 +489,33 @@ INSTRUCCIONES:
 - Si el usuario quiere salir, ejecuta `logout_user()` y despídete.
 """
 
-        self.agent_graph = create_react_agent(
+        self._system_message = SystemMessage(content=self.system_prompt)
+        self.agent_graph = self._build_graph(self.memory)
+
+    def _prompt(self, state: Dict) -> List:
+        """
+        Model input: fixed system prompt (and tool schemas) first, then the history with
+        a single, current context block on the latest user message. Everything before
+        that message is byte-identical between calls, so provider prefix caching applies.
+        """
+        return [self._system_message, *compact_context(state["messages"])]
+
+    def _build_graph(self, checkpointer):
+        return create_react_agent(
             self.llm, 
             self.tools, 
-            prompt=self.system_prompt,
-            checkpointer=self.memory
+            prompt=self._prompt,
+            pre_model_hook=trim_history,
+            checkpointer=checkpointer
         )
 
+    def set_checkpointer(self, checkpointer):
+        """Swaps the in-process memory for a durable, shared checkpointer (same tools and LLM)."""
+        if not self.api_key or checkpointer is None:
+            return
+        self.memory = checkpointer
+        self.agent_graph = self._build_graph(checkpointer)
+
     async def process_input(self, session_id: str, text: str, context: Dict = None) -> Dict:
         """
         Process user text input and return text response + actions.
@@ -321,13 +523,19 @@ INSTRUCCIONES:
         if not self.api_key:
             return {"text": "Error: OpenAI API Key missing.", "actions": []}
 
-        full_input = f"{text}\nContext: {json.dumps(context) if context else '{}'}"
         action_callback = ActionCaptureCallback()
+        unit_of_work = TurnUnitOfWork()
         
         try:
-            inputs = {"messages": [HumanMessage(content=full_input)]}
+            full_input = await self._format_input(session_id, text, context)
+            fast_result = await self._fast_path(session_id, text, full_input)
+            if fast_result:
+                return fast_result
+
+            input_message = HumanMessage(content=full_input, id=str(uuid.uuid4()))
+            inputs = {"messages": [input_message]}
             config = {
-                "configurable": {"thread_id": session_id},
+                "configurable": {"thread_id": session_id, UOW_CONFIG_KEY: unit_of_work},
                 "callbacks": [action_callback]
             }
             
@@ -337,12 +545,241 @@ INSTRUCCIONES:
             response_text = "No entendí eso."
             if result["messages"]:
                 response_text = result["messages"][-1].content
+            actions = action_callback.actions
+
+            try:
+                await unit_of_work.commit()
+            except TurnConflict as conflict:
+                response_text, actions = await self._discard_turn_writes(session_id, conflict)
                 
             return {
                 "text": response_text,
-                "actions": action_callback.actions
+                "actions": actions,
+                "usage": self._record_usage(result["messages"], input_message.id)
             }
             
+        except asyncio.CancelledError:
+            if unit_of_work.has_writes:
+                await self.repair_interrupted_turn(session_id, discarded_writes=True)
+            raise
         except Exception as e:
             print(f"Agent Error: {e}")
+            if unit_of_work.has_writes:
+                await self._discard_turn_writes(session_id, e)
             return {"text": "Lo siento, encontré un error.", "actions": []}
+        finally:
+            await unit_of_work.close()
+
+    async def stream_input(self, session_id: str, text: str, context: Dict = None) -> AsyncIterator[Dict]:
+        """
+        Streaming variant of process_input.
+        Yields {"type": "token", "text": <delta>} while the final answer is generated,
+        then a single {"type": "done", "text": ..., "actions": [...]}.
+        """
+        if not self.api_key:
+            yield {"type": "done", "text": "Error: OpenAI API Key missing.", "actions": []}
+            return
+
+        action_callback = ActionCaptureCallback()
+        unit_of_work = TurnUnitOfWork()
+        config = {
+            "configurable": {"thread_id": session_id, UOW_CONFIG_KEY: unit_of_work},
+            "callbacks": [action_callback]
+        }
+
+        try:
+            full_input = await self._format_input(session_id, text, context)
+            fast_result = await self._fast_path(session_id, text, full_input)
+            if fast_result:
+                yield {"type": "token", "text": fast_result["text"]}
+                yield {"type": "done", **fast_result}
+                return
+
+            input_message = HumanMessage(content=full_input, id=str(uuid.uuid4()))
+            inputs = {"messages": [input_message]}
+            streamed = False
+
+            async for event in self.agent_graph.astream_events(inputs, config=config, version="v2"):
+                if event["event"] != "on_chat_model_stream":
+                    continue
+                chunk = event["data"]["chunk"]
+                # Only speak answer text, never tool-call argument deltas
+                if chunk.tool_call_chunks or not isinstance(chunk.content, str) or not chunk.content:
+                    continue
+                streamed = True
+                yield {"type": "token", "text": chunk.content}
+
+            state = await self.agent_graph.aget_state(config)
+            messages = state.values.get("messages", [])
+            response_text = messages[-1].content if messages else "No entendí eso."
+            if not streamed:
+                yield {"type": "token", "text": response_text}
+            actions = action_callback.actions
+
+            try:
+                await unit_of_work.commit()
+            except TurnConflict as conflict:
+                # The answer was already spoken: the correction follows it
+                response_text, actions = await self._discard_turn_writes(session_id, conflict)
+                yield {"type": "token", "text": " " + response_text}
+
+            yield {
+                "type": "done",
+                "text": response_text,
+                "actions": actions,
+                "usage": self._record_usage(messages, input_message.id)
+            }
+
+        except asyncio.CancelledError:
+            if unit_of_work.has_writes:
+                await self.repair_interrupted_turn(session_id, discarded_writes=True)
+            raise
+        except Exception as e:
+            print(f"Agent Error: {e}")
+            if unit_of_work.has_writes:
+                await self._discard_turn_writes(session_id, e)
+            message = "Lo siento, encontré un error."
+            yield {"type": "token", "text": message}
+            yield {"type": "done", "text": message, "actions": []}
+        finally:
+            await unit_of_work.close()
+
+    async def repair_interrupted_turn(self, session_id: str, discarded_writes: bool = False):
+        """
+        Called after a turn is cancelled mid-run. If the checkpoint stopped between the
+        model's tool calls and their results, the calls are closed with a "cancelled"
+        result so the next LLM request sees a valid history. With discarded_writes the
+        closing message also tells the model that the turn's changes were not saved.
+        Safe to call repeatedly.
+        """
+        note = "(Turno interrumpido por el usuario.)"
+        if discarded_writes:
+            note = "(Turno interrumpido por el usuario: no se guardó ningún cambio del turno.)"
+        await self._close_turn(session_id, "Cancelado: el usuario interrumpió el turno.", note, always=discarded_writes)
+
+    async def _discard_turn_writes(self, session_id: str, error: Exception):
+        """
+        The turn's writes were rolled back (failed turn or TurnConflict at commit).
+        The thread still holds tool results describing them, so a note tells the model
+        they were not saved. Returns the text and actions to send to the client.
+        """
+        message = "No se guardó ningún cambio: el inventario cambió mientras procesaba la orden. Inténtalo de nuevo."
+        if not isinstance(error, TurnConflict):
+            message = "No se guardó ningún cambio por un error."
+        await self._close_turn(session_id, f"Error: {message}", f"({message})", always=True)
+        return message, [{"action": "error", "message": message}]
+
+    async def _close_turn(self, session_id: str, tool_result: str, note: str, always: bool):
+        """Answers tool calls left without a result, then appends `note` (if any call was open, or always)."""
+        if not self.api_key:
+            return
+        config = {"configurable": {"thread_id": session_id}}
+        try:
+            state = await self.agent_graph.aget_state(config)
+        except Exception as e:
+            print(f"Agent Error: {e}")
+            return
+        messages = state.values.get("messages", [])
+
+        pending = []
+        for message in reversed(messages):
+            if isinstance(message, ToolMessage):
+                pending.append(message.tool_call_id)
+                continue
+            if isinstance(message, AIMessage) and message.tool_calls:
+                answered = set(pending)
+                pending = [call["id"] for call in message.tool_calls if call["id"] not in answered]
+            else:
+                pending = []
+            break
+
+        if not pending and not always:
+            return
+        try:
+            await self.agent_graph.aupdate_state(config, {"messages": [
+                *[ToolMessage(content=tool_result, tool_call_id=call_id) for call_id in pending],
+                AIMessage(content=note)
+            ]}, as_node="agent")
+        except Exception as e:
+            print(f"Agent Error: {e}")
+
+    def forget_session(self, session_id: str):
+        """
+        Called when the client disconnects. In-process threads get a short grace period
+        so a reconnecting client can resume; durable stores expire threads themselves.
+        """
+        if self.api_key and isinstance(self.memory, BoundedMemorySaver):
+            self.memory.release(session_id)
+
+    def stats(self) -> dict:
+        if not self.api_key:
+            return {}
+        stats = {"llm_usage": dict(self.usage_totals)}
+        if isinstance(self.memory, BoundedMemorySaver):
+            stats["memory"] = self.memory.stats()
+        return stats
+
+    async def _format_input(self, session_id: str, text: str, context: Dict = None) -> str:
+        """
+        User message for this turn: the text plus only the context keys that changed
+        since the thread last saw them (the baseline is folded from the thread itself,
+        so it holds across workers and restarts).
+        """
+        state = await self.agent_graph.aget_state({"configurable": {"thread_id": session_id}})
+        previous = fold_context(state.values.get("messages", []))
+        return with_context(text, diff_context(previous, context or {}))
+
+    def _record_usage(self, messages: List, input_id: str) -> Dict:
+        """Token usage of the LLM calls made after this turn's user message."""
+        usage = {"llm_calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0}
+        start = next((i for i, m in enumerate(messages) if m.id == input_id), None)
+        if start is None:
+            return usage
+
+        for message in messages[start + 1:]:
+            if not isinstance(message, AIMessage) or not message.usage_metadata:
+                continue
+            metadata = message.usage_metadata
+            usage["llm_calls"] += 1
+            usage["input_tokens"] += metadata.get("input_tokens", 0)
+            usage["output_tokens"] += metadata.get("output_tokens", 0)
+            usage["cached_tokens"] += (metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+        self.usage_totals["turns"] += 1
+        for key, value in usage.items():
+            self.usage_totals[key] += value
+        print(
+            f"[AGENT] Tokens: {usage['input_tokens']} in ({usage['cached_tokens']} cached), "
+            f"{usage['output_tokens']} out, {usage['llm_calls']} LLM calls"
+        )
+        return usage
+
+    async def _fast_path(self, session_id: str, text: str, full_input: str):
+        """
+        Runs a tool directly when the intent router is confident, bypassing the LLM.
+        The exchange is written to the thread as a regular tool call so later
+        LLM turns see a coherent history. Returns None to fall back to the agent.
+        """
+        if not self.intent_router:
+            return None
+        match = self.intent_router.match(text)
+        if not match:
+            return None
+
+        tool_output = await self.tools_by_name[match.tool].ainvoke(match.args)
+        data = json.loads(tool_output)
+        if data.get("action") == "error":
+            return None
+
+        response_text = match.render(data)
+        tool_call_id = f"call_fast_{uuid.uuid4().hex[:16]}"
+        config = {"configurable": {"thread_id": session_id}}
+        await self.agent_graph.aupdate_state(config, {"messages": [
+            HumanMessage(content=full_input),
+            AIMessage(content="", tool_calls=[{"name": match.tool, "args": match.args, "id": tool_call_id}]),
+            ToolMessage(content=tool_output, tool_call_id=tool_call_id, name=match.tool),
+            AIMessage(content=response_text),
+        ]}, as_node="agent")
+
+        print(f"[AGENT] Fast path: {match.tool} {match.args} (confidence {match.confidence:.2f})")
+        return {"text": response_text, "actions": [data]}
@@ -0,0 +1,90 @@
+import io
+import os
+import subprocess
+import wave
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Whisper expects 16 kHz mono float32 PCM
+WHISPER_SAMPLE_RATE = 16000
+
+# Largest audio payload accepted from a client (checked before any decoding)
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(5 * 1024 * 1024)))
+
+# Codecs accepted on voice_input and the filename the STT upload needs for each
+CODEC_FILENAMES = {
+    "webm/opus": "audio.webm",
+    "ogg/opus": "audio.ogg",
+    "mp4/aac": "audio.m4a",
+    "mpeg/mp3": "audio.mp3",
+    "wav/pcm": "audio.wav",
+}
+
+# Raw PCM streamed by voice_chunk (mono, little-endian 16-bit)
+PCM_CODEC = "pcm/s16le"
+
+# Outbound TTS audio (OpenAI tts-1 and Edge both produce 24 kHz MP3)
+TTS_AUDIO_FORMAT = {"codec": "mpeg/mp3", "sample_rate": 24000}
+
+class AudioDecodeError(Exception):
+    """Raised when ffmpeg cannot decode the incoming audio."""
+
+class AudioPayloadError(ValueError):
+    """Raised when a client sends audio we refuse to process."""
+
+def validate_audio_payload(audio, codec: str, allowed=CODEC_FILENAMES) -> bytes:
+    """
+    Checks a binary Socket.IO attachment before it reaches STT.
+    Only raw bytes are accepted (no JS number lists), within MAX_AUDIO_BYTES.
+    """
+    if isinstance(audio, memoryview):
+        audio = audio.tobytes()
+    if not isinstance(audio, (bytes, bytearray)):
+        raise AudioPayloadError("Audio must be sent as a binary attachment")
+    if len(audio) > MAX_AUDIO_BYTES:
+        raise AudioPayloadError(f"Audio exceeds {MAX_AUDIO_BYTES} bytes")
+    if codec not in allowed:
+        raise AudioPayloadError(f"Unsupported codec '{codec}'")
+    return bytes(audio)
+
+def as_upload(audio_bytes: bytes, filename: str = "audio.webm") -> io.BytesIO:
+    """Wraps raw audio in a named in-memory file the OpenAI client can upload."""
+    buffer = io.BytesIO(audio_bytes)
+    buffer.name = filename
+    return buffer
+
+def decode_audio(audio_bytes: bytes, sample_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Decodes a compressed blob (webm/opus, ogg, mp3...) to float32 PCM in memory.
+    ffmpeg reads from stdin and writes raw s16le to stdout; nothing touches the disk.
+    """
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-i", "pipe:0",
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "pipe:1"
+    ]
+    try:
+        result = subprocess.run(cmd, input=audio_bytes, capture_output=True, check=True)
+    except FileNotFoundError:
+        raise AudioDecodeError("ffmpeg not found in PATH")
+    except subprocess.CalledProcessError as e:
+        raise AudioDecodeError(e.stderr.decode(errors="ignore").strip())
+
+    return pcm16_to_float32(result.stdout)
+
+def pcm16_to_float32(pcm: bytes) -> np.ndarray:
+    """Converts little-endian signed 16-bit PCM to float32 in [-1, 1]."""
+    return np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wraps mono 16-bit PCM in an in-memory WAV container (for STT uploads)."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return buffer.getvalue()
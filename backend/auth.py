@@ -1,5 +1,13 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 import os
@@ -12,7 +20,28 @@ SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production-pet-s
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing cost and capacity
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32"))
+# Failed logins allowed per client address, and per account from one address, in each window
+LOGIN_MAX_ATTEMPTS = int(os.getenv("LOGIN_MAX_ATTEMPTS", "10"))
+LOGIN_WINDOW_SECONDS = float(os.getenv("LOGIN_WINDOW_SECONDS", "60"))
+# Registrations allowed per client address in each window
+REGISTER_MAX_ATTEMPTS = int(os.getenv("REGISTER_MAX_ATTEMPTS", "5"))
+# Reverse proxies whose X-Forwarded-For is trusted to name the real client
+TRUSTED_PROXIES = {p.strip() for p in os.getenv("TRUSTED_PROXIES", "").split(",") if p.strip()}
+
+# Hashes made with a different cost are reported by needs_update and rehashed on login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+# bcrypt releases the GIL: a small dedicated pool keeps hashing off the event loop
+# and caps how many cores a login storm can take
+_hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_hash_pending = 0
+
+class PasswordHashBusy(Exception):
+    """Demasiados hashes en cola: el cliente debe reintentar más tarde."""
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verifica una contraseña contra su hash"""
@@ -22,6 +51,101 @@ def get_password_hash(password: str) -> str:
     """Genera hash de contraseña"""
     return pwd_context.hash(password)
 
+async def _run_hashing(fn, *args):
+    # Bounded backlog: a flood of requests is rejected instead of queueing behind the pool
+    global _hash_pending
+    if _hash_pending >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHashBusy(f"{_hash_pending} hashes pendientes")
+    _hash_pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_hash_executor, fn, *args)
+    finally:
+        _hash_pending -= 1
+
+async def hash_password_async(password: str) -> str:
+    """get_password_hash() en el pool de hashing"""
+    return await _run_hashing(pwd_context.hash, password)
+
+async def verify_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica en el pool de hashing. Devuelve (válida, nuevo_hash); nuevo_hash no es None
+    cuando el hash guardado usa otro coste y debe reemplazarse.
+    """
+    return await _run_hashing(pwd_context.verify_and_update, plain_password, hashed_password)
+
+def shutdown_password_hashing():
+    _hash_executor.shutdown(wait=False, cancel_futures=True)
+
+class LoginRateLimiter:
+    """
+    Límite de intentos en ventana deslizante por clave (dirección del cliente, cuenta...).
+    Se comprueba antes de hashear, así los intentos repetidos no pueden consumir CPU.
+    """
+
+    def __init__(self, max_attempts: int = LOGIN_MAX_ATTEMPTS, window: float = LOGIN_WINDOW_SECONDS):
+        self.max_attempts = max_attempts
+        self.window = window
+        self._attempts = defaultdict(deque)
+        self.rejected = 0
+
+    def retry_after(self, *keys: str) -> float:
+        """0 si ninguna clave ha agotado sus intentos; si no, los segundos a esperar"""
+        now = time.monotonic()
+        wait = 0.0
+        for key in keys:
+            attempts = self._attempts.get(key)
+            if not attempts:
+                continue
+            while attempts and now - attempts[0] >= self.window:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                wait = max(wait, self.window - (now - attempts[0]))
+        if wait:
+            self.rejected += 1
+        return wait
+
+    def record(self, *keys: str):
+        now = time.monotonic()
+        for key in keys:
+            self._attempts[key].append(now)
+        self._prune(now)
+
+    def hit(self, *keys: str) -> float:
+        """Comprueba y, si se permite, registra el intento"""
+        wait = self.retry_after(*keys)
+        if not wait:
+            self.record(*keys)
+        return wait
+
+    def reset(self, key: str):
+        self._attempts.pop(key, None)
+
+    def _prune(self, now: float):
+        # Bounded memory under a spray of distinct keys
+        if len(self._attempts) > 10000:
+            for key in [k for k, a in self._attempts.items() if not a or now - a[-1] >= self.window]:
+                del self._attempts[key]
+
+    def stats(self) -> dict:
+        return {"tracked_keys": len(self._attempts), "rejected": self.rejected}
+
+# Only failed logins count, so a shift change behind one shared address is never throttled
+login_limiter = LoginRateLimiter()
+register_limiter = LoginRateLimiter(max_attempts=REGISTER_MAX_ATTEMPTS)
+
+def client_address(host: Optional[str], forwarded_for: Optional[str]) -> str:
+    """
+    Dirección real del cliente. X-Forwarded-For solo se usa si la conexión viene de un
+    proxy de confianza, y se toma la última entrada que no sea otro proxy de confianza.
+    """
+    host = host or "unknown"
+    if host not in TRUSTED_PROXIES or not forwarded_for:
+        return host
+    for address in reversed([a.strip() for a in forwarded_for.split(",") if a.strip()]):
+        if address not in TRUSTED_PROXIES:
+            return address
+    return host
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crea un JWT token"""
     to_encode = data.copy()
@@ -40,3 +164,22 @@ def decode_token(token: str):
         return payload
     except JWTError:
         return None
+
+def issue_session_id(subject: str = "") -> str:
+    """
+    Id de conversación firmado por el servidor para Socket.IO, ligado al usuario del
+    token (o anónimo). Un cliente no puede elegir ni adivinar el hilo de otro.
+    """
+    thread_id = secrets.token_urlsafe(16)
+    return f"{thread_id}.{_session_signature(thread_id, subject)}"
+
+def verify_session_id(session_id: Optional[str], subject: str = "") -> Optional[str]:
+    """Hilo de conversación de un id emitido por issue_session_id, o None si no es válido"""
+    thread_id, _, signature = (session_id or "").rpartition(".")
+    if not thread_id or not hmac.compare_digest(signature, _session_signature(thread_id, subject)):
+        return None
+    return thread_id
+
+def _session_signature(thread_id: str, subject: str) -> str:
+    digest = hmac.new(SECRET_KEY.encode(), f"session|{subject}|{thread_id}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest[:18]).decode()
@@ -0,0 +1,106 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+from auth import decode_token
+from models import User
+
+load_dotenv()
+
+# Authentication cache configuration
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", "30"))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_USER_CACHE_MAX_ENTRIES", "1024"))
+AUTH_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_TOKEN_CACHE_MAX_ENTRIES", "4096"))
+
+class TTLCache:
+    """Bounded LRU whose entries also expire; each entry may carry its own deadline."""
+
+    def __init__(self, max_entries: int, ttl: float = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        if self.max_entries <= 0 or not ttl or ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+# Token digest -> decoded payload, kept until the token itself expires
+_tokens = TTLCache(AUTH_TOKEN_CACHE_MAX_ENTRIES)
+# Token subject (email) -> detached copy of the user row
+_users = TTLCache(AUTH_USER_CACHE_MAX_ENTRIES, AUTH_USER_CACHE_TTL)
+
+def decode_token_cached(token: str) -> Optional[Dict]:
+    """decode_token() with the signature check done once per token instead of once per request."""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    payload = _tokens.get(key)
+    if payload is not None:
+        # A cached payload was valid when stored; its deadline is the token's exp
+        return payload
+
+    payload = decode_token(token)
+    if payload is not None:
+        exp = payload.get("exp")
+        ttl = exp - time.time() if isinstance(exp, (int, float)) else AUTH_USER_CACHE_TTL
+        _tokens.set(key, payload, ttl)
+    return payload
+
+def _snapshot(user: User) -> User:
+    # Transient copy: never attached to a session, so requests can share it safely
+    return User(**{column.key: getattr(user, column.key) for column in User.__table__.columns})
+
+def get_cached_user(email: str) -> Optional[User]:
+    return _users.get(email)
+
+def cache_user(user: User) -> User:
+    snapshot = _snapshot(user)
+    _users.set(user.email, snapshot)
+    return snapshot
+
+def invalidate_user(email: str):
+    """Call after a user is updated or deleted; other workers catch up within the TTL."""
+    _users.pop(email)
+
+def auth_cache_stats() -> dict:
+    return {"users": _users.stats(), "tokens": _tokens.stats()}
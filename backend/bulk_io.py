@@ -0,0 +1,120 @@
+import codecs
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator, Dict, Tuple, Union
+from dotenv import load_dotenv
+from sqlalchemy import select
+
+from database import AsyncSessionLocal
+from models import Producto
+
+load_dotenv()
+
+# Bulk import/export configuration
+BULK_BATCH_SIZE = int(os.getenv("BULK_BATCH_SIZE", "1000"))
+BULK_MAX_ERRORS = int(os.getenv("BULK_MAX_ERRORS", "500"))
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "1000"))
+
+EXPORT_FIELDS = ["id", "nombre", "descripcion", "categoria", "ubicacion", "cantidad", "fecha_registro", "registrado_por"]
+
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+def detect_format(content_type: str, requested: str = None) -> str:
+    if requested:
+        return requested
+    if "json" in (content_type or ""):
+        return "ndjson"
+    return "csv"
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decodes a byte stream into lines without holding the whole body."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+async def parse_rows(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, Union[Dict, str]]]:
+    """
+    Yields (line number, row dict) for each record, or (line number, error message)
+    for records that cannot be parsed. Empty CSV cells are dropped so schema defaults apply.
+    """
+    header = None
+    record, record_line = "", 0
+    line_no = 0
+
+    async for line in iter_lines(chunks):
+        line_no += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"JSON inválido: {e}"
+                continue
+            yield line_no, row if isinstance(row, dict) else "Cada línea debe ser un objeto JSON"
+            continue
+
+        # CSV: a quoted field may span lines; the record is complete when quotes balance
+        if not record:
+            record_line = line_no
+            if not line.strip():
+                continue
+        record = f"{record}\n{line}" if record else line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]))
+        record = ""
+
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        if len(values) != len(header):
+            yield record_line, f"Se esperaban {len(header)} columnas, hay {len(values)}"
+            continue
+        yield record_line, {k: v.strip() for k, v in zip(header, values) if v.strip() != ""}
+
+    if record:
+        yield record_line, "Comillas sin cerrar al final del fichero"
+
+def _export_row(row) -> Dict:
+    data = dict(row._mapping)
+    data["categoria"] = data["categoria"].value if data["categoria"] else None
+    data["fecha_registro"] = data["fecha_registro"].isoformat() if data["fecha_registro"] else None
+    return data
+
+async def export_rows(fmt: str) -> AsyncIterator[str]:
+    """
+    Streams the whole table as CSV or NDJSON.
+    Rows come from a server-side cursor (yield_per), so memory stays flat
+    whatever the table size. Uses its own session: the response outlives the request scope.
+    """
+    query = (
+        select(*[getattr(Producto, f) for f in EXPORT_FIELDS])
+        .order_by(Producto.id)
+        .execution_options(yield_per=EXPORT_CHUNK_ROWS)
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query)
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            async for partition in result.partitions():
+                for row in partition:
+                    writer.writerow(_export_row(row).values())
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        else:
+            async for partition in result.partitions():
+                yield "".join(json.dumps(_export_row(row), ensure_ascii=False) + "\n" for row in partition)
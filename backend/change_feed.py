@@ -0,0 +1,176 @@
+import asyncio
+import enum
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from sqlalchemy import event, inspect, insert, update
+from sqlalchemy.orm import Session
+
+from models import Producto, TableVersion
+from http_cache import product_version
+
+# Socket.IO room that receives inventory deltas, and the event name
+INVENTORY_ROOM = "inventory"
+INVENTORY_EVENT = "inventory_delta"
+
+_CHANGES_KEY = "inventory_changes"
+_VERSION_KEY = "inventory_version"
+# Set by any write to productos; only an outer rollback clears it, so the version never misses one
+_TOUCHED_KEY = "inventory_touched"
+_FIELDS = [column.key for column in Producto.__table__.columns]
+
+def _json_value(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _open_transactions(session: Session) -> List:
+    """The transactions a change made now belongs to, innermost first."""
+    transaction = session.get_nested_transaction() or session.get_transaction()
+    chain = []
+    while transaction is not None:
+        chain.append(transaction)
+        transaction = transaction.parent
+    return chain
+
+def record_change(session: Session, op: str, product_id: int = None, fields: Dict = None):
+    """
+    Queues a delta for the session's next commit. The ORM hooks below call it for
+    every flushed Producto; Core statements (bulk insert, atomic stock UPDATE) call it by hand.
+    op: created | updated | deleted | reload (too many rows: clients should refetch).
+    """
+    change = {"op": op}
+    if product_id is not None:
+        change["id"] = product_id
+    if fields:
+        change["fields"] = {key: _json_value(value) for key, value in fields.items()}
+    session.info[_TOUCHED_KEY] = True
+    session.info.setdefault(_CHANGES_KEY, []).append((change, _open_transactions(session)))
+
+def _merge(changes: List[Dict]) -> List[Dict]:
+    """One entry per product: created+updated -> created, created+deleted -> nothing."""
+    merged: Dict = {}
+    for change in changes:
+        if change["op"] == "reload":
+            return [change]
+        previous = merged.get(change["id"])
+        if previous is None:
+            merged[change["id"]] = change
+        elif change["op"] == "deleted":
+            if previous["op"] == "created":
+                del merged[change["id"]]
+            else:
+                merged[change["id"]] = change
+        elif previous["op"] != "deleted":
+            previous.setdefault("fields", {}).update(change.get("fields", {}))
+    return list(merged.values())
+
+class InventoryFeed:
+    """
+    Broadcasts committed product changes to connected clients.
+    Each committing transaction bumps the "productos" row of table_versions, so deltas carry
+    a version shared by every worker; a client that sees a gap refetches instead of patching.
+    """
+
+    def __init__(self):
+        self._emit: Optional[Callable[[Dict], Awaitable]] = None
+        self._loop = None
+        self._tasks = set()
+        self.published = 0
+
+    def start(self, emit: Callable[[Dict], Awaitable]):
+        """Binds the feed to the running event loop; commits before this are not broadcast."""
+        self._emit = emit
+        self._loop = asyncio.get_running_loop()
+
+    def publish(self, payload: Dict):
+        if self._emit is None:
+            return
+        # Sessions may commit from worker threads: hop onto the loop before emitting
+        self._loop.call_soon_threadsafe(self._schedule, payload)
+
+    def _schedule(self, payload: Dict):
+        task = self._loop.create_task(self._send(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, payload: Dict):
+        try:
+            await self._emit(payload)
+            self.published += 1
+        except Exception as e:
+            print(f"[FEED] Error broadcasting version {payload['version']}: {e}")
+
+    def stats(self) -> dict:
+        return {"published": self.published, "pending": len(self._tasks)}
+
+inventory_feed = InventoryFeed()
+
+def bump_version(session: Session, table_name: str) -> int:
+    row = session.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name == table_name)
+        .values(version=TableVersion.version + 1)
+        .returning(TableVersion.version)
+        .execution_options(synchronize_session=False)
+    ).first()
+    if row is not None:
+        return row.version
+    session.execute(insert(TableVersion).values(table_name=table_name, version=1))
+    return 1
+
+@event.listens_for(Session, "after_flush")
+def _collect_product_changes(session, flush_context):
+    if any(isinstance(obj, Producto) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info[_TOUCHED_KEY] = True
+    for obj in session.new:
+        if isinstance(obj, Producto):
+            record_change(session, "created", obj.id, {key: getattr(obj, key) for key in _FIELDS})
+    for obj in session.dirty:
+        if isinstance(obj, Producto):
+            state = inspect(obj)
+            fields = {key: getattr(obj, key) for key in _FIELDS if state.attrs[key].history.has_changes()}
+            if fields:
+                record_change(session, "updated", obj.id, fields)
+    for obj in session.deleted:
+        if isinstance(obj, Producto):
+            record_change(session, "deleted", obj.id)
+
+@event.listens_for(Session, "after_soft_rollback")
+def _discard_rolled_back(session, previous_transaction):
+    # A rolled-back SAVEPOINT drops only the changes made inside it
+    changes = session.info.get(_CHANGES_KEY)
+    if changes:
+        changes[:] = [entry for entry in changes if previous_transaction not in entry[1]]
+
+@event.listens_for(Session, "before_commit")
+def _number_changes(session):
+    # Releasing a SAVEPOINT fires the commit events too; only the real commit counts
+    if session.in_nested_transaction():
+        return
+    # Flush first so the last pending changes are collected before numbering them
+    session.flush()
+    if session.info.pop(_TOUCHED_KEY, False):
+        session.info[_VERSION_KEY] = bump_version(session, Producto.__tablename__)
+
+@event.listens_for(Session, "after_commit")
+def _publish_changes(session):
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop(_CHANGES_KEY, None) or []
+    version = session.info.pop(_VERSION_KEY, None)
+    if version is not None:
+        # ETags and cached pages of this worker move on at once
+        product_version.note(version)
+        # Sent even with no changes left, so clients do not take the version for a gap
+        inventory_feed.publish({"version": version, "changes": _merge([change for change, _ in changes])})
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    # Also fired for a SAVEPOINT rollback: _discard_rolled_back handles those
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGES_KEY, None)
+    session.info.pop(_VERSION_KEY, None)
+    session.info.pop(_TOUCHED_KEY, None)
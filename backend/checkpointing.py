@@ -0,0 +1,63 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Conversation state backend: "memory" (single process), "sqlite" or "redis" (shared)
+CHECKPOINT_BACKEND = os.getenv("CHECKPOINT_BACKEND", "memory").lower()
+CHECKPOINT_SQLITE_PATH = os.getenv("CHECKPOINT_SQLITE_PATH", "./checkpoints.db")
+CHECKPOINT_REDIS_URL = os.getenv("CHECKPOINT_REDIS_URL", "redis://localhost:6379/0")
+CHECKPOINT_TTL_MINUTES = int(os.getenv("CHECKPOINT_TTL_MINUTES", "1440"))
+
+# Socket.IO message queue shared by every worker (e.g. redis://localhost:6379/1); empty = single process
+SOCKETIO_MESSAGE_QUEUE = os.getenv("SOCKETIO_MESSAGE_QUEUE", "")
+
+def is_durable() -> bool:
+    """True when conversation state outlives the process (and is shared by workers)."""
+    return CHECKPOINT_BACKEND != "memory"
+
+def create_client_manager():
+    """Socket.IO client manager: Redis pub/sub when several workers serve the same clients."""
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return None
+    import socketio
+    return socketio.AsyncRedisManager(SOCKETIO_MESSAGE_QUEUE)
+
+async def open_checkpointer():
+    """
+    Opens the configured durable checkpointer.
+    Returns (checkpointer, close) or (None, None) for the in-process default.
+    """
+    if CHECKPOINT_BACKEND == "memory":
+        return None, None
+
+    if CHECKPOINT_BACKEND == "sqlite":
+        import aiosqlite
+        from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+        conn = await aiosqlite.connect(CHECKPOINT_SQLITE_PATH)
+        # WAL lets several worker processes read while one writes
+        await conn.execute("PRAGMA journal_mode=WAL")
+        await conn.execute("PRAGMA synchronous=NORMAL")
+        await conn.execute("PRAGMA busy_timeout=5000")
+        saver = AsyncSqliteSaver(conn)
+        await saver.setup()
+        print(f"[MEMORY] SQLite checkpointer at {CHECKPOINT_SQLITE_PATH}")
+        return saver, conn.close
+
+    if CHECKPOINT_BACKEND == "redis":
+        from langgraph.checkpoint.redis.aio import AsyncRedisSaver
+
+        saver = AsyncRedisSaver(
+            redis_url=CHECKPOINT_REDIS_URL,
+            # Idle threads expire natively; reads keep active ones alive
+            ttl={"default_ttl": CHECKPOINT_TTL_MINUTES, "refresh_on_read": True}
+        )
+        await saver.asetup()
+        print(f"[MEMORY] Redis checkpointer at {CHECKPOINT_REDIS_URL}")
+
+        async def close():
+            await saver.__aexit__(None, None, None)
+        return saver, close
+
+    raise ValueError(f"Unknown CHECKPOINT_BACKEND '{CHECKPOINT_BACKEND}'")
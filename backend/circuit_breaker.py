@@ -0,0 +1,172 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from dotenv import load_dotenv
+
+from outbound import OutboundBusy, is_rate_limited
+
+load_dotenv()
+
+# Circuit breaker configuration
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+BREAKER_PROBE_INTERVAL = float(os.getenv("BREAKER_PROBE_INTERVAL", "10"))
+BREAKER_PROBE_TIMEOUT = float(os.getenv("BREAKER_PROBE_TIMEOUT", "3"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class CircuitOpen(Exception):
+    """The provider is considered down; the caller should use its fallback right away."""
+
+def _neutral(exc: BaseException) -> bool:
+    """Outcomes that say nothing about provider health (our own limits, barge-in)."""
+    return isinstance(exc, (OutboundBusy, asyncio.CancelledError, GeneratorExit)) or is_rate_limited(exc)
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+    closed: calls go through; `failure_threshold` consecutive failures open it.
+    open: calls are rejected immediately (CircuitOpen). A background probe checks the
+          provider every `probe_interval` seconds; without a probe the circuit moves to
+          half-open after `reset_timeout`.
+    half_open: a single trial call decides between closed and open again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_timeout: float = BREAKER_RESET_TIMEOUT,
+        probe: Optional[Callable[[], Awaitable]] = None,
+        probe_interval: float = BREAKER_PROBE_INTERVAL,
+        probe_timeout: float = BREAKER_PROBE_TIMEOUT
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe = probe
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._probe_task = None
+
+        self.successes = 0
+        self.failures = 0
+        self.short_circuited = 0
+        self.opened = 0
+        self.last_error = None
+
+    def available(self) -> bool:
+        """Whether allow() would let a call through right now, without claiming the half-open trial."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return not self.probe and time.monotonic() - self._opened_at >= self.reset_timeout
+        return not self._trial_in_flight
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if self.probe or time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self._set_state(HALF_OPEN)
+        # Half-open: one trial at a time
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    @asynccontextmanager
+    async def guard(self):
+        """Wraps one provider call; raises CircuitOpen without calling when the circuit is open."""
+        if not self.allow():
+            self.short_circuited += 1
+            raise CircuitOpen(f"{self.name} circuit open")
+        try:
+            yield
+        except BaseException as e:
+            if _neutral(e):
+                self._trial_in_flight = False
+            else:
+                self.record_failure(e)
+            raise
+        else:
+            self.record_success()
+
+    def record_success(self):
+        self.successes += 1
+        self._failures = 0
+        self._trial_in_flight = False
+        if self.state != CLOSED:
+            print(f"[BREAKER] {self.name} recovered, circuit closed")
+            self._set_state(CLOSED)
+
+    def record_failure(self, error: BaseException):
+        self.failures += 1
+        self._failures += 1
+        self._trial_in_flight = False
+        self.last_error = f"{type(error).__name__}: {error}"[:200]
+        if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        if self.state != OPEN:
+            self.opened += 1
+            print(f"[BREAKER] {self.name} circuit open after {self._failures} failures ({self.last_error})")
+        self._set_state(OPEN)
+        self._opened_at = time.monotonic()
+        if self.probe and (self._probe_task is None or self._probe_task.done()):
+            self._probe_task = asyncio.create_task(self._probe_loop())
+
+    def _set_state(self, state: str):
+        self.state = state
+
+    async def _probe_loop(self):
+        """Checks the provider in the background while the circuit is open; users never wait on it."""
+        while self.state == OPEN:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                await asyncio.wait_for(self.probe(), timeout=self.probe_timeout)
+            except Exception as e:
+                self.last_error = f"probe {type(e).__name__}: {e}"[:200]
+                continue
+            # Healthy again: let the next real call confirm it
+            self._set_state(HALF_OPEN)
+
+    def stop(self):
+        if self._probe_task:
+            self._probe_task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "successes": self.successes,
+            "failures": self.failures,
+            "short_circuited": self.short_circuited,
+            "opened": self.opened,
+            "last_error": self.last_error,
+        }
+
+async def with_first_chunk_timeout(chunks: AsyncIterator[bytes], timeout: float) -> AsyncIterator[bytes]:
+    """Bounds the wait for the first chunk of a stream (a hung provider fails fast)."""
+    iterator = chunks.__aiter__()
+    try:
+        try:
+            first = await asyncio.wait_for(iterator.__anext__(), timeout=timeout)
+        except StopAsyncIteration:
+            return
+        yield first
+        async for chunk in iterator:
+            yield chunk
+    finally:
+        await iterator.aclose()
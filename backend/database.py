@@ -1,7 +1,10 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,15 +12,155 @@ load_dotenv()
 # SQLite para desarrollo, PostgreSQL para producción
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./pet_shop_inventory.db")
 
+# Connection pool (per engine; ignored for in-memory SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Checkouts that wait longer than this are logged
+DB_POOL_SLOW_CHECKOUT_MS = float(os.getenv("DB_POOL_SLOW_CHECKOUT_MS", "50"))
+
+# SQLite connection pragmas
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() in ("1", "true", "yes")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+
+class CheckoutStats:
+    """Wait time spent getting a connection out of the pool"""
+
+    def __init__(self):
+        self.checkouts = 0
+        self.slow = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def record(self, wait_ms: float):
+        self.checkouts += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        if wait_ms >= DB_POOL_SLOW_CHECKOUT_MS:
+            self.slow += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "checkouts": self.checkouts,
+            "slow_checkouts": self.slow,
+            "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 2) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+# Kept at module level: a pool may be recreated (dispose/invalidate) under the same engine
+POOL_STATS = {"sync": CheckoutStats(), "async": CheckoutStats()}
+
+class _TimedCheckout:
+    """Pool mixin that measures (and logs, when slow) the wait for a free connection"""
+    stats_key = "sync"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        connection = super()._do_get()
+        wait_ms = (time.perf_counter() - start) * 1000
+        POOL_STATS[self.stats_key].record(wait_ms)
+        if wait_ms >= DB_POOL_SLOW_CHECKOUT_MS:
+            print(
+                f"[DB] {self.stats_key} pool checkout waited {wait_ms:.0f} ms "
+                f"({self.checkedout()} in use, size {self.size()}, overflow {self.overflow()})"
+            )
+        return connection
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    stats_key = "sync"
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    stats_key = "async"
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+def _pool_options(url: str, poolclass) -> dict:
+    if _is_sqlite(url) and (":memory:" in url or url.rstrip("/").endswith(":")):
+        # In-memory databases live in a single connection; keep SQLAlchemy's default pool
+        return {}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers proceed while a writer commits, busy_timeout makes a
+    blocked writer wait instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.close()
+
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
+    connect_args={"check_same_thread": False} if _is_sqlite(DATABASE_URL) else {},
+    **_pool_options(DATABASE_URL, TimedQueuePool)
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str) -> str:
+    """Same database through an async driver (aiosqlite / asyncpg)"""
+    if url.startswith("sqlite:"):
+        return url.replace("sqlite:", "sqlite+aiosqlite:", 1)
+    if url.startswith("postgresql:") or url.startswith("postgres:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Async engine for the event loop (agent tools, async routers)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **_pool_options(ASYNC_DATABASE_URL, TimedAsyncQueuePool)
+)
+
+def _sqlite_autocommit_driver(dbapi_connection, connection_record):
+    # The driver's own implicit BEGIN breaks SAVEPOINT (releasing the outermost one
+    # commits); SQLAlchemy emits BEGIN itself instead (see _sqlite_begin)
+    dbapi_connection.isolation_level = None
+
+def _sqlite_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+def _configure_sqlite(sync_engine):
+    event.listen(sync_engine, "connect", _set_sqlite_pragmas)
+    event.listen(sync_engine, "connect", _sqlite_autocommit_driver)
+    event.listen(sync_engine, "begin", _sqlite_begin)
+
+if _is_sqlite(DATABASE_URL):
+    _configure_sqlite(engine)
+if _is_sqlite(ASYNC_DATABASE_URL):
+    _configure_sqlite(async_engine.sync_engine)
+
+# expire_on_commit=False: objects stay readable after commit without lazy (blocking) reloads
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
+def pool_stats() -> dict:
+    """Checkout wait times and current usage of both connection pools"""
+    stats = {}
+    for key, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        entry = POOL_STATS[key].as_dict()
+        if isinstance(pool, QueuePool):
+            entry.update(in_use=pool.checkedout(), idle=pool.checkedin(), size=pool.size())
+        stats[key] = entry
+    return stats
+
 def get_db():
     """Dependency para obtener sesión de BD"""
     db = SessionLocal()
@@ -25,3 +168,8 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    """Dependency para obtener sesión async de BD"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -1,15 +1,16 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
-from auth import decode_token
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
+from auth_cache import decode_token_cached, get_cached_user, cache_user
 from models import User
 
 security = HTTPBearer()
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Obtiene el usuario actual desde el token"""
     credentials_exception = HTTPException(
@@ -19,7 +20,7 @@ async def get_current_user(
     )
     
     token = credentials.credentials
-    payload = decode_token(token)
+    payload = decode_token_cached(token)
     
     if payload is None:
         raise credentials_exception
@@ -28,9 +29,13 @@ async def get_current_user(
     if email is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    user = get_cached_user(email)
     if user is None:
-        raise credentials_exception
+        result = await db.execute(select(User).where(User.email == email))
+        user = result.scalars().first()
+        if user is None:
+            raise credentials_exception
+        user = cache_user(user)
     
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Usuario inactivo")
@@ -0,0 +1,110 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Producto, TableVersion
+
+load_dotenv()
+
+# HTTP caching configuration
+# Versions committed by this process are seen at once; other workers' after at most this long
+TABLE_VERSION_TTL = float(os.getenv("TABLE_VERSION_TTL", "1"))
+PRODUCT_PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PRODUCT_PAGE_CACHE_MAX_ENTRIES", "256"))
+
+# The client must revalidate every time, and shared caches must not keep per-user responses
+CACHE_CONTROL = "private, no-cache"
+
+class TableVersionTracker:
+    """
+    Last known value of a table_versions row. Local commits update it directly
+    (note); the database is re-read at most every `ttl` seconds to pick up other workers.
+    """
+
+    def __init__(self, table_name: str, ttl: float = TABLE_VERSION_TTL):
+        self.table_name = table_name
+        self.ttl = ttl
+        self.version = None
+        self._checked_at = 0.0
+        self.reads = 0
+
+    def note(self, version: int):
+        if self.version is None or version > self.version:
+            self.version = version
+
+    async def current(self, db: AsyncSession) -> int:
+        if self.version is not None and time.monotonic() - self._checked_at < self.ttl:
+            return self.version
+        stored = (await db.execute(
+            select(TableVersion.version).where(TableVersion.table_name == self.table_name)
+        )).scalar()
+        self.reads += 1
+        self._checked_at = time.monotonic()
+        self.note(stored or 0)
+        return self.version
+
+class PageCache:
+    """Serialized JSON bodies for one table version; a newer version drops every entry."""
+
+    def __init__(self, max_entries: int = PRODUCT_PAGE_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.version = None
+        self._entries: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: int, key: Tuple) -> Optional[bytes]:
+        if version != self.version:
+            self.version = version
+            self._entries.clear()
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def set(self, version: int, key: Tuple, body: bytes):
+        if version != self.version or self.max_entries <= 0:
+            return
+        self._entries[key] = body
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"version": self.version, "entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+product_version = TableVersionTracker(Producto.__tablename__)
+product_pages = PageCache()
+_not_modified = 0
+
+def make_etag(version: int, *parts) -> str:
+    return '"' + "-".join(str(p) for p in ("p", version, *parts)) + '"'
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """304 when If-None-Match already names `etag` (weak comparison, RFC 9110 13.1.2)."""
+    global _not_modified
+    header = request.headers.get("if-none-match")
+    if not header:
+        return None
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    if "*" not in candidates and etag not in candidates:
+        return None
+    _not_modified += 1
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def json_response(body: bytes, etag: str) -> Response:
+    return Response(content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+def http_cache_stats() -> dict:
+    return {
+        "product_version": product_version.version,
+        "version_reads": product_version.reads,
+        "pages": product_pages.stats(),
+        "not_modified": _not_modified,
+    }
@@ -0,0 +1,155 @@
+import os
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Fast-path configuration
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "true").lower() in ("1", "true", "yes")
+INTENT_FUZZY_THRESHOLD = float(os.getenv("INTENT_FUZZY_THRESHOLD", "0.88"))
+
+# Spoken category names -> CategoriaEnum values
+CATEGORY_SYNONYMS = {
+    "alimentacion": "alimentacion", "alimentos": "alimentacion", "comida": "alimentacion",
+    "piensos": "alimentacion", "pienso": "alimentacion",
+    "juguetes": "juguetes", "juguete": "juguetes",
+    "accesorios": "accesorios", "accesorio": "accesorios",
+    "salud": "salud", "medicamentos": "salud", "medicinas": "salud",
+    "higiene": "higiene",
+    "otros": "otros",
+}
+
+# Politeness and filler words that never change the intent
+_FILLERS = re.compile(r"\b(por favor|porfa|oye|vale|venga|ahora|puedes|podrias|quiero|me)\b")
+
+def normalize_utterance(text: str) -> str:
+    """Lowercase, accent-free, punctuation-free form used for matching."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^a-z0-9ñ ]+", " ", text)
+    text = _FILLERS.sub(" ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def _render_listing(data: Dict) -> str:
+    products = data.get("products", [])
+    if not products:
+        return "No hay productos registrados en esa categoría."
+    items = ", ".join(f"{p['nombre']} ({p['cantidad']} en {p['ubicacion']})" for p in products)
+    return f"Hay {data.get('count', len(products))} productos: {items}."
+
+class Intent:
+    def __init__(
+        self,
+        tool: str,
+        patterns: List[str],
+        examples: List[str],
+        response: Callable[[Dict], str],
+        args: Callable[[re.Match], Dict] = None
+    ):
+        self.tool = tool
+        self.patterns = [re.compile(p) for p in patterns]
+        self.examples = examples
+        self.response = response
+        self.args = args or (lambda match: {})
+
+class IntentMatch:
+    def __init__(self, intent: Intent, args: Dict, confidence: float):
+        self.intent = intent
+        self.tool = intent.tool
+        self.args = args
+        self.confidence = confidence
+
+    def render(self, tool_output: Dict) -> str:
+        return self.intent.response(tool_output)
+
+_CATEGORY_WORDS = "|".join(sorted(CATEGORY_SYNONYMS, key=len, reverse=True))
+
+INTENTS = [
+    Intent(
+        tool="cerrar_formulario_producto",
+        patterns=[
+            r"^(cierra|cerrar|cancela|cancelar|oculta)( el)? formulario( de producto)?$",
+            r"^cancela(r)?$",
+        ],
+        examples=["cerrar formulario", "cierra el formulario", "cancelar formulario"],
+        response=lambda data: "He cerrado el formulario.",
+    ),
+    Intent(
+        tool="abrir_formulario_producto",
+        patterns=[
+            r"^(abre|abrir|muestra|mostrar)( el)? formulario( de( nuevo)? producto)?$",
+            r"^(anadir|agregar|registrar|crear)( un)?( nuevo)? producto$",
+        ],
+        examples=["abre el formulario", "abrir formulario", "anadir un producto"],
+        response=lambda data: "He abierto el formulario. ¿Cómo se llama el producto?",
+    ),
+    Intent(
+        tool="logout_user",
+        patterns=[
+            r"^(salir|desconectar|desconectarme)$",
+            r"^(cierra|cerrar)( la| mi)? sesion$",
+        ],
+        examples=["salir", "cerrar sesion", "cierra la sesion"],
+        response=lambda data: "Has cerrado la sesión. ¡Hasta luego!",
+    ),
+    Intent(
+        tool="listar_productos",
+        patterns=[
+            rf"^(lista|listar|muestra|muestrame|mostrar|ensena|ensename|dime|ver)( todos)?( los| las| el| la)? (?P<cat>{_CATEGORY_WORDS})$",
+            r"^(lista|listar|muestra|muestrame|mostrar|ensename|dime|ver)( todos)?( los)? productos$",
+            r"^(que )?(productos|inventario) (hay|tenemos)$",
+        ],
+        examples=["lista los productos", "muestra los productos", "que productos hay"],
+        response=_render_listing,
+        args=lambda match: (
+            {"categoria": CATEGORY_SYNONYMS[match.group("cat")]}
+            if "cat" in match.groupdict() and match.group("cat") else {}
+        ),
+    ),
+]
+
+class IntentRouter:
+    """
+    Deterministic matcher for simple commands that map one-to-one onto a tool.
+    Regex grammar first; fuzzy matching against example phrases as a fallback
+    for minor transcription errors.
+    """
+
+    def __init__(self, intents: List[Intent] = None, fuzzy_threshold: float = INTENT_FUZZY_THRESHOLD):
+        self.intents = intents or INTENTS
+        self.fuzzy_threshold = fuzzy_threshold
+
+    def match(self, text: str) -> Optional[IntentMatch]:
+        utterance = normalize_utterance(text)
+        if not utterance:
+            return None
+
+        for intent in self.intents:
+            for pattern in intent.patterns:
+                found = pattern.match(utterance)
+                if found:
+                    return IntentMatch(intent, intent.args(found), 1.0)
+
+        best, best_score = None, 0.0
+        for intent in self.intents:
+            for example in intent.examples:
+                score = SequenceMatcher(None, utterance, example).ratio()
+                if score > best_score:
+                    best, best_score = intent, score
+
+        if best and best_score >= self.fuzzy_threshold:
+            # Fuzzy hits only trust the intent, never extracted arguments
+            return IntentMatch(best, {}, best_score)
+        return None
+
+    def static_phrases(self) -> List[str]:
+        """Fixed responses worth pre-warming in the TTS cache."""
+        phrases = []
+        for intent in self.intents:
+            if intent.response is _render_listing:
+                continue
+            phrases.append(intent.response({}))
+        return phrases
@@ -1,14 +1,34 @@
 import socketio
 import uvicorn
 import asyncio
-import base64
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from pydantic import ValidationError
 
 # Local modules
 from voice_processor import VoiceProcessor
 from agent import InteractionAgent
-from database import engine, Base
+from speech_pipeline import SpeechPipeline
+from voice_stream import VoiceStreamSession, SPEECH_START, ENDPOINT, VAD_SAMPLE_RATES
+from audio_codec import (
+    validate_audio_payload,
+    AudioPayloadError,
+    CODEC_FILENAMES,
+    MAX_AUDIO_BYTES,
+    PCM_CODEC,
+    TTS_AUDIO_FORMAT
+)
+from schemas import AudioFormat
+from checkpointing import open_checkpointer, create_client_manager
+from database import engine, Base, pool_stats
+from search import product_index
+from change_feed import inventory_feed, INVENTORY_ROOM, INVENTORY_EVENT
+from http_cache import http_cache_stats
+from turns import TurnScheduler, TurnCancelled
+from outbound import outbound_stats, PRIORITY_BACKGROUND
+from auth_cache import auth_cache_stats
+from dependencies import get_current_admin_user
+from auth import login_limiter, register_limiter, shutdown_password_hashing, decode_token, issue_session_id, verify_session_id
 from models import User, Producto
 
 # Routers
@@ -16,6 +36,9 @@ from routers import auth, users, products
 
 # Crear tablas si no existen
 Base.metadata.create_all(bind=engine)
+# create_all only indexes new tables; add indexes introduced later to existing ones
+for index in Producto.__table__.indexes:
+    index.create(bind=engine, checkfirst=True)
 
 # Initialize FastAPI
 app = FastAPI(title="Pet Shop  Inventory API")
@@ -35,59 +58,192 @@ app.include_router(users.router)
 app.include_router(products.router)
 
 # Initialize Socket.IO
-sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*')
+# Binary attachments are capped at the transport level too (small margin for the JSON envelope)
+# With SOCKETIO_MESSAGE_QUEUE set, emits are relayed between workers (horizontal scaling)
+sio = socketio.AsyncServer(
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    max_http_buffer_size=MAX_AUDIO_BYTES + 64 * 1024,
+    client_manager=create_client_manager()
+)
 socket_app = socketio.ASGIApp(sio, app)
 
+# Closes the durable checkpointer on shutdown (None for in-process memory)
+close_checkpointer = None
+
+# Active microphone streams (voice_stream_start .. voice_stream_end), keyed by sid
+voice_streams = {}
+
 # Initialize Components
 try:
     voice_processor = VoiceProcessor()
     agent = InteractionAgent()
+    speech_pipeline = SpeechPipeline(voice_processor.tts_stream)
     print("✅ Pet Shop Inventory System Initialized")
 except Exception as e:
     print(f"❌ Error Initializing Components: {e}")
 
+@app.on_event("startup")
+async def startup():
+    global close_checkpointer
+    checkpointer, close_checkpointer = await open_checkpointer()
+    agent.set_checkpointer(checkpointer)
+
+    # Committed product changes are pushed to every connected client
+    inventory_feed.start(lambda payload: sio.emit(INVENTORY_EVENT, payload, room=INVENTORY_ROOM))
+
+    await voice_processor.start(
+        prewarm_phrases=agent.intent_router.static_phrases() if getattr(agent, "intent_router", None) else []
+    )
+
+@app.on_event("shutdown")
+async def shutdown():
+    voice_processor.shutdown()
+    shutdown_password_hashing()
+    if close_checkpointer:
+        await close_checkpointer()
+
 @app.get("/")
 async def root():
     return {"message": "Pet Shop Inventory API", "version": "2.0.0"}
 
+@app.get("/metrics")
+async def metrics(current_user: User = Depends(get_current_admin_user)):
+    """Runtime counters for the voice pipeline, the agent, the database pools, search, outbound calls, authentication, the inventory feed and HTTP caching (administrators only: they include raw provider errors)"""
+    return {
+        **voice_processor.stats(),
+        **agent.stats(),
+        "db_pool": pool_stats(),
+        "search": product_index.stats(),
+        "turns": turn_scheduler.stats(),
+        "outbound": outbound_stats(),
+        "auth_cache": auth_cache_stats(),
+        "login": login_limiter.stats(),
+        "register": register_limiter.stats(),
+        "inventory_feed": inventory_feed.stats(),
+        "http_cache": http_cache_stats(),
+    }
+
 @sio.event
-async def connect(sid, environ):
-    print(f"Client connected: {sid}")
-    await sio.emit('connection_ack', {'sid': sid}, to=sid)
+async def connect(sid, environ, auth=None):
+    # The client sends back the session_id issued in connection_ack so its conversation
+    # thread survives reconnects and can be served by any worker. The id is signed by the
+    # server and bound to the JWT subject: a client cannot pick another user's thread.
+    auth = auth or {}
+    if not isinstance(auth, dict):
+        raise socketio.exceptions.ConnectionRefusedError('Invalid auth payload')
+    token = auth.get('token')
+    payload = decode_token(token) if isinstance(token, str) and token else None
+    subject = (payload or {}).get('sub') or ""
+    session_id = auth.get('session_id') if isinstance(auth.get('session_id'), str) else None
+    thread_id = verify_session_id(session_id, subject)
+    if thread_id is None:
+        session_id = issue_session_id(subject)
+        thread_id = verify_session_id(session_id, subject)
+    await sio.save_session(sid, {'thread_id': thread_id})
+    # Deltas carry product fields: only sockets with a valid token receive them
+    if subject:
+        await sio.enter_room(sid, INVENTORY_ROOM)
+    await sio.enter_room(sid, thread_room(thread_id))
+
+    print(f"Client connected: {sid} (thread {thread_id})")
+    await sio.emit('connection_ack', {'sid': sid, 'session_id': session_id}, to=sid)
 
 @sio.event
 async def disconnect(sid):
     print(f"Client disconnected: {sid}")
+    thread_id = await thread_id_for(sid)
+    # Another connection on the same thread keeps its own turn running
+    await turn_scheduler.cancel(thread_id, "disconnected", owner=sid)
+    agent.forget_session(thread_id)
+    stream_session = voice_streams.pop(sid, None)
+    if stream_session:
+        stream_session.close()
 
 @sio.event
 async def voice_input(sid, data):
     """
     Handle incoming voice data (audio blob) or text override.
-    data: { 'audio': <bytes/None>, 'text': <str/None>, 'context': <dict> }
+    data: {
+        'audio': <binary attachment/None>,
+        'format': { 'codec': 'webm/opus', 'sample_rate': 48000 },
+        'text': <str/None>, 'context': <dict>, 'stream': <bool>
+    }
+    With stream=True the reply is spoken sentence by sentence as voice_audio_chunk events.
     """
     audio_data = data.get('audio')
     text_input = data.get('text')
     context = data.get('context', {})
+    stream = data.get('stream', False)
 
     print(f"[VOICE] Input from {sid}")
 
-    # 1. STT (if audio provided)
-    user_text = text_input
+    # Invalid payloads are rejected before they can supersede the turn in flight
     if audio_data:
-        # If passed as list/bytearray from JS, convert to bytes
-        if isinstance(audio_data, list):
-            audio_data = bytes(audio_data)
-        user_text = await voice_processor.stt(audio_data)
-    
-    if not user_text:
-        await sio.emit('error', {'message': 'Could not understand audio'}, to=sid)
-        return
+        try:
+            audio_format = AudioFormat(**(data.get('format') or {}))
+            audio_data = validate_audio_payload(audio_data, audio_format.codec)
+        except (ValidationError, AudioPayloadError) as e:
+            await sio.emit('error', {'message': f'Invalid audio: {e}'}, to=sid)
+            return
+
+    async def turn():
+        # 1. STT (if audio provided)
+        user_text = text_input
+        if audio_data:
+            user_text = await voice_processor.stt(audio_data, CODEC_FILENAMES[audio_format.codec])
+
+        if not user_text:
+            await sio.emit('error', {'message': 'Could not understand audio'}, to=sid)
+            return
+
+        print(f"[VOICE] Transcribed: {user_text}")
+        await run_voice_turn(sid, user_text, context, stream)
+
+    await run_turn(sid, turn)
+
+async def run_turn(sid, turn):
+    """
+    Runs a turn through the per-thread scheduler: a newer utterance or message on the
+    same conversation (from this or another connection, e.g. a second tab or a reconnect)
+    cancels the one in flight (LLM call and pending TTS) before its own turn starts.
+    """
+    thread_id = await thread_id_for(sid)
+    try:
+        await turn_scheduler.run(thread_id, turn, owner=sid)
+    except TurnCancelled:
+        print(f"[TURN] Turn for {sid} (thread {thread_id}) was interrupted")
+
+async def on_turn_cancelled(thread_id, turn_id, reason):
+    await agent.repair_interrupted_turn(thread_id)
+    # Every connection on the thread learns its pending reply was dropped
+    await sio.emit('turn_cancelled', {'turn_id': turn_id, 'reason': reason}, room=thread_room(thread_id))
+
+turn_scheduler = TurnScheduler(on_cancelled=on_turn_cancelled)
+
+@sio.event
+async def cancel_turn(sid, data=None):
+    """Barge-in / stop: cancels the turn in flight. Emits turn_cancelled if one was running."""
+    await turn_scheduler.cancel(await thread_id_for(sid))
 
-    print(f"[VOICE] Transcribed: {user_text}")
+def thread_room(thread_id):
+    """Socket.IO room joined by every connection on a conversation thread."""
+    return f"thread:{thread_id}"
+
+async def thread_id_for(sid):
+    """Conversation thread bound to a Socket.IO connection."""
+    session = await sio.get_session(sid)
+    return session.get('thread_id', sid)
+
+async def run_voice_turn(sid, user_text, context, stream):
+    """Agent + TTS part of a voice turn, shared by voice_input and microphone streams."""
+    if stream:
+        await stream_voice_turn(sid, user_text, context)
+        return
 
     # 2. Process with Agent
-    # Pass session_id (sid) for memory
-    agent_result = await agent.process_input(sid, user_text, context)
+    # Pass the conversation thread for memory
+    agent_result = await agent.process_input(await thread_id_for(sid), user_text, context)
     response_text = agent_result["text"]
     actions = agent_result["actions"]
 
@@ -96,16 +252,163 @@ async def voice_input(sid, data):
 
     # 3. TTS
     audio_response_bytes = await voice_processor.tts(response_text)
-    audio_base64 = base64.b64encode(audio_response_bytes).decode('utf-8') if audio_response_bytes else None
     
-    # 4. Emit Response
+    # 4. Emit Response (audio travels as a binary attachment)
     await sio.emit('voice_response', {
         'text': response_text,
-        'audio': audio_base64, 
+        'audio': audio_response_bytes or None,
+        'audio_format': TTS_AUDIO_FORMAT,
         'user_text': user_text,
         'actions': actions
     }, to=sid)
 
+async def stream_voice_turn(sid, user_text, context):
+    """
+    Streaming turn: agent tokens are cut into sentences and each sentence is
+    synthesized while the next one is still being generated.
+    voice_response (text + actions, no audio) is emitted as soon as the agent finishes;
+    audio keeps flowing as voice_audio_chunk events.
+    """
+    thread_id = await thread_id_for(sid)
+
+    async def agent_tokens():
+        async for event in agent.stream_input(thread_id, user_text, context):
+            if event["type"] == "token":
+                yield event["text"]
+                continue
+
+            print(f"[AGENT] Response: {event['text']}")
+            print(f"[AGENT] Actions: {event['actions']}")
+            await sio.emit('voice_response', {
+                'text': event["text"],
+                'audio': None,
+                'stream': True,
+                'user_text': user_text,
+                'actions': event["actions"]
+            }, to=sid)
+
+    await emit_audio_stream(sid, speech_pipeline.stream(agent_tokens()))
+
+async def emit_audio_stream(sid, chunks):
+    """
+    Forwards TTS audio chunks to the client as they are produced.
+    Emits: voice_audio_chunk { 'seq': <int>, 'audio': <bytes/None>, 'format': <dict>, 'final': <bool> }
+    The last event carries final=True and no audio.
+    """
+    seq = 0
+    async for chunk in chunks:
+        await sio.emit('voice_audio_chunk', {
+            'seq': seq,
+            'audio': chunk,
+            'format': TTS_AUDIO_FORMAT,
+            'final': False
+        }, to=sid)
+        seq += 1
+
+    await sio.emit('voice_audio_chunk', {'seq': seq, 'audio': None, 'format': TTS_AUDIO_FORMAT, 'final': True}, to=sid)
+
+@sio.event
+async def voice_stream_start(sid, data):
+    """
+    Opens a live microphone stream.
+    data: { 'format': { 'codec': 'pcm/s16le', 'sample_rate': 16000 }, 'context': <dict>, 'stream': <bool> }
+    PCM then arrives as voice_chunk events; the server endpoints the utterance itself.
+    """
+    data = data or {}
+    try:
+        audio_format = AudioFormat(**(data.get('format') or {'codec': PCM_CODEC, 'sample_rate': 16000}))
+    except ValidationError as e:
+        await sio.emit('error', {'message': f'Invalid audio format: {e}'}, to=sid)
+        return
+    if audio_format.codec != PCM_CODEC:
+        await sio.emit('error', {'message': f'Microphone streams must use {PCM_CODEC}'}, to=sid)
+        return
+    if audio_format.sample_rate not in VAD_SAMPLE_RATES:
+        await sio.emit('error', {'message': f'Microphone streams must use one of {VAD_SAMPLE_RATES} Hz'}, to=sid)
+        return
+
+    previous = voice_streams.pop(sid, None)
+    if previous:
+        previous.close()
+    voice_streams[sid] = VoiceStreamSession(
+        audio_format.sample_rate,
+        context=data.get('context', {}),
+        stream=data.get('stream', True)
+    )
+    print(f"[VOICE] Stream started for {sid} ({audio_format.sample_rate} Hz)")
+
+@sio.event
+async def voice_chunk(sid, data):
+    """
+    PCM frames for the active stream.
+    data: { 'audio': <binary attachment> }
+    Emits partial_transcript while the user talks and voice_stream_endpoint when speech ends.
+    """
+    stream_session = voice_streams.get(sid)
+    if not stream_session or stream_session.ended:
+        return
+
+    audio = data.get('audio') if isinstance(data, dict) else data
+    try:
+        audio = validate_audio_payload(audio, PCM_CODEC, allowed=(PCM_CODEC,))
+    except AudioPayloadError as e:
+        await sio.emit('error', {'message': f'Invalid audio: {e}'}, to=sid)
+        return
+
+    events = stream_session.feed(audio)
+    if SPEECH_START in events:
+        await sio.emit('voice_stream_speech', {}, to=sid)
+
+    if ENDPOINT in events:
+        await finish_voice_stream(sid)
+        return
+
+    if stream_session.wants_partial():
+        stream_session.partial_task = asyncio.create_task(
+            emit_partial_transcript(sid, stream_session, stream_session.partial_audio(), stream_session.partial_truncated)
+        )
+
+@sio.event
+async def voice_stream_end(sid, data=None):
+    """Client stopped the microphone (key released) before the server endpointed."""
+    await finish_voice_stream(sid)
+
+async def emit_partial_transcript(sid, stream_session, pcm, truncated):
+    """
+    Emits partial_transcript { 'text': <str>, 'truncated': <bool> }.
+    truncated: the text covers only the trailing window of the utterance.
+    """
+    # Partial transcripts are disposable: they queue behind final ones
+    text = await voice_processor.stt_pcm(pcm, stream_session.sample_rate, PRIORITY_BACKGROUND)
+    if text and not stream_session.ended:
+        await sio.emit('partial_transcript', {'text': text, 'truncated': truncated}, to=sid)
+
+async def finish_voice_stream(sid):
+    """Transcribes the trimmed utterance and runs the turn."""
+    stream_session = voice_streams.pop(sid, None)
+    if not stream_session:
+        return
+    stream_session.close()
+    await sio.emit('voice_stream_endpoint', {}, to=sid)
+
+    pcm = stream_session.utterance()
+    if not pcm:
+        await sio.emit('error', {'message': 'No speech detected'}, to=sid)
+        return
+
+    print(f"[VOICE] Stream endpoint for {sid} ({stream_session.speech_ms} ms of speech)")
+
+    async def turn():
+        user_text = await voice_processor.stt_pcm(pcm, stream_session.sample_rate)
+        if not user_text:
+            await sio.emit('error', {'message': 'Could not understand audio'}, to=sid)
+            return
+
+        print(f"[VOICE] Transcribed: {user_text}")
+        await run_voice_turn(sid, user_text, stream_session.context, stream_session.stream)
+
+    await run_turn(sid, turn)
+
 @sio.event
 async def chat_message(sid, data):
     """
@@ -117,14 +420,17 @@ async def chat_message(sid, data):
     
     print(f"[CHAT] Message from {sid}: {user_text}")
     
-    # Process with Agent
-    agent_result = await agent.process_input(sid, user_text, context)
-    
-    # Emit back response
-    await sio.emit('chat_response', {
-        'text': agent_result["text"],
-        'actions': agent_result["actions"]
-    }, to=sid)
+    async def turn():
+        # Process with Agent
+        agent_result = await agent.process_input(await thread_id_for(sid), user_text, context)
+
+        # Emit back response
+        await sio.emit('chat_response', {
+            'text': agent_result["text"],
+            'actions': agent_result["actions"]
+        }, to=sid)
+
+    await run_turn(sid, turn)
 
 if __name__ == "__main__":
     uvicorn.run("main:socket_app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,241 @@
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, RemoveMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+load_dotenv()
+
+# Conversation memory configuration
+MEMORY_MAX_THREADS = int(os.getenv("MEMORY_MAX_THREADS", "500"))
+MEMORY_IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", "3600"))
+MEMORY_MAX_CHECKPOINTS = int(os.getenv("MEMORY_MAX_CHECKPOINTS", "4"))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "3000"))
+# Once over the limit, history is cut down to this fraction of it, so the trimmed
+# prefix stays identical for several turns (provider prompt caching keeps hitting)
+MEMORY_TRIM_TARGET = float(os.getenv("MEMORY_TRIM_TARGET", "0.6"))
+# Grace period for threads whose client disconnected (lets a reconnecting client resume)
+MEMORY_DETACHED_TTL = float(os.getenv("MEMORY_DETACHED_TTL", "300"))
+
+# ===== UI CONTEXT BLOCKS =====
+# User messages carry only what changed in the UI context since the previous turn,
+# appended as "\nContext: {json}" (a null value means the key was removed).
+
+CONTEXT_MARKER = "\nContext: "
+
+def dump_context(context: Dict) -> str:
+    # Sorted, compact JSON: the same context always serializes to the same tokens
+    return json.dumps(context, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+def with_context(text: str, context: Optional[Dict]) -> str:
+    return f"{text}{CONTEXT_MARKER}{dump_context(context)}" if context else text
+
+def split_context(content) -> Tuple[str, Optional[Dict]]:
+    """Splits a user message into its text and its context block (None if it has none)."""
+    if not isinstance(content, str) or CONTEXT_MARKER not in content:
+        return content, None
+    text, raw = content.rsplit(CONTEXT_MARKER, 1)
+    try:
+        context = json.loads(raw)
+    except ValueError:
+        return content, None
+    return (text, context) if isinstance(context, dict) else (content, None)
+
+def merge_context(base: Dict, delta: Dict) -> Dict:
+    merged = dict(base)
+    for key, value in delta.items():
+        if value is None:
+            merged.pop(key, None)
+        else:
+            merged[key] = value
+    return merged
+
+def fold_context(messages: List) -> Dict:
+    """Current UI context: every context block in the history applied in order."""
+    context = {}
+    for message in messages:
+        if isinstance(message, HumanMessage):
+            _, delta = split_context(message.content)
+            if delta:
+                context = merge_context(context, delta)
+    return context
+
+def diff_context(previous: Dict, current: Dict) -> Dict:
+    """Keys whose value changed since `previous` (removed keys map to None)."""
+    changed = {k: v for k, v in current.items() if previous.get(k) != v}
+    changed.update({k: None for k in previous if k not in current})
+    return changed
+
+def compact_context(messages: List) -> List:
+    """
+    LLM view of the history: context blocks are stripped from every user message
+    and the folded current context is attached once, to the latest one. Older
+    messages then never change between calls, so the cached prompt prefix holds.
+    """
+    context = fold_context(messages)
+    last_human = max((i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=None)
+
+    compacted = []
+    for i, message in enumerate(messages):
+        if isinstance(message, HumanMessage):
+            text, delta = split_context(message.content)
+            if i == last_human:
+                text = with_context(text, context)
+            if delta is not None or i == last_human:
+                message = message.model_copy(update={"content": text})
+        compacted.append(message)
+    return compacted
+
+def trim_history(state: Dict) -> Dict:
+    """
+    pre_model_hook for the ReAct agent: keeps the thread under MEMORY_MAX_TOKENS.
+    Drops whole turns from the front (the window always starts on a user message,
+    so no tool result is left without its tool call), down to MEMORY_TRIM_TARGET of
+    the limit. Context deltas of dropped turns are folded into the first kept
+    message. The trimmed list replaces the stored history, which also bounds what
+    the checkpointer keeps.
+    """
+    messages = state["messages"]
+    if count_tokens_approximately(messages) <= MEMORY_MAX_TOKENS:
+        return {}
+
+    turn_starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if not turn_starts:
+        return {}
+
+    # Earliest turn boundary whose tail fits the target; never drop the current turn
+    target = MEMORY_MAX_TOKENS * MEMORY_TRIM_TARGET
+    start = turn_starts[-1]
+    for i in turn_starts:
+        if count_tokens_approximately(messages[i:]) <= target:
+            start = i
+            break
+
+    if start == 0:
+        return {}
+
+    first = messages[start]
+    text, delta = split_context(first.content)
+    context = merge_context(fold_context(messages[:start]), delta or {})
+    kept = [first.model_copy(update={"content": with_context(text, context)}), *messages[start + 1:]]
+    return {"messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES), *kept]}
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    In-process checkpointer with bounded growth:
+    - only the last MEMORY_MAX_CHECKPOINTS checkpoints (and their blobs) of a thread are kept
+    - threads idle for MEMORY_IDLE_TTL seconds, or beyond MEMORY_MAX_THREADS (LRU), are evicted
+    - threads released by a disconnect are evicted after MEMORY_DETACHED_TTL unless resumed
+    """
+
+    def __init__(
+        self,
+        max_threads: int = MEMORY_MAX_THREADS,
+        idle_ttl: float = MEMORY_IDLE_TTL,
+        max_checkpoints: int = MEMORY_MAX_CHECKPOINTS,
+        detached_ttl: float = MEMORY_DETACHED_TTL
+    ):
+        super().__init__()
+        self.max_threads = max_threads
+        self.idle_ttl = idle_ttl
+        self.detached_ttl = detached_ttl
+        # The latest checkpoint and its parent are needed to resume a run
+        self.max_checkpoints = max(max_checkpoints, 2)
+        self.evictions = 0
+
+        self._last_seen: "OrderedDict[str, float]" = OrderedDict()
+        self._detached = set()
+        # (thread_id, ns) -> {checkpoint_id: channel_versions}, to know which blobs are still referenced
+        self._versions = defaultdict(dict)
+        # (thread_id, ns) -> blob keys written for that namespace
+        self._blob_keys = defaultdict(set)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        result = super().put(config, checkpoint, metadata, new_versions)
+
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        key = (thread_id, checkpoint_ns)
+        self._versions[key][checkpoint["id"]] = dict(checkpoint["channel_versions"])
+        self._blob_keys[key].update((thread_id, checkpoint_ns, k, v) for k, v in new_versions.items())
+
+        self._prune(thread_id, checkpoint_ns)
+        self._touch(thread_id)
+        self.evict_idle()
+        return result
+
+    def get_tuple(self, config):
+        thread_id = config["configurable"].get("thread_id")
+        if thread_id in self._last_seen:
+            self._touch(thread_id)
+        return super().get_tuple(config)
+
+    def release(self, thread_id: str):
+        """Marks a thread as detached (its client left); it expires after detached_ttl."""
+        if thread_id in self._last_seen:
+            self._detached.add(thread_id)
+        self.evict_idle()
+
+    def delete_thread(self, thread_id: str) -> None:
+        super().delete_thread(thread_id)
+        self._last_seen.pop(thread_id, None)
+        self._detached.discard(thread_id)
+        for key in [k for k in self._versions if k[0] == thread_id]:
+            self._versions.pop(key, None)
+            self._blob_keys.pop(key, None)
+
+    def evict_idle(self):
+        """Drops idle threads and the least recently used ones past the limit."""
+        now = time.monotonic()
+        for thread_id in list(self._detached):
+            if now - self._last_seen.get(thread_id, 0) >= self.detached_ttl:
+                self.delete_thread(thread_id)
+                self.evictions += 1
+
+        while self._last_seen:
+            thread_id, last_seen = next(iter(self._last_seen.items()))
+            if now - last_seen < self.idle_ttl and len(self._last_seen) <= self.max_threads:
+                break
+            self.delete_thread(thread_id)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        return {
+            "threads": len(self._last_seen),
+            "detached": len(self._detached),
+            "checkpoints": sum(len(v) for v in self._versions.values()),
+            "blobs": len(self.blobs),
+            "evictions": self.evictions,
+        }
+
+    def _touch(self, thread_id: str):
+        self._detached.discard(thread_id)
+        self._last_seen[thread_id] = time.monotonic()
+        self._last_seen.move_to_end(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str):
+        key = (thread_id, checkpoint_ns)
+        saved = self.storage[thread_id][checkpoint_ns]
+        if len(saved) <= self.max_checkpoints:
+            return
+
+        # Checkpoint ids are time-ordered, newest last
+        stale = sorted(saved)[:-self.max_checkpoints]
+        for checkpoint_id in stale:
+            saved.pop(checkpoint_id, None)
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            self._versions[key].pop(checkpoint_id, None)
+
+        referenced = {
+            (thread_id, checkpoint_ns, channel, version)
+            for versions in self._versions[key].values()
+            for channel, version in versions.items()
+        }
+        for blob_key in self._blob_keys[key] - referenced:
+            self.blobs.pop(blob_key, None)
+        self._blob_keys[key] &= referenced
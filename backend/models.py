@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, Text, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -45,3 +45,18 @@ class Producto(Base):
     
     # Relación
     registrado_por_user = relationship("User", back_populates="productos_registrados")
+
+    # Keyset pagination: each filter/sort combination reads an index range ending in id
+    __table_args__ = (
+        Index("ix_productos_categoria_id", "categoria", "id"),
+        Index("ix_productos_categoria_fecha_id", "categoria", "fecha_registro", "id"),
+        Index("ix_productos_ubicacion_id", "ubicacion", "id"),
+        Index("ix_productos_fecha_id", "fecha_registro", "id"),
+    )
+
+class TableVersion(Base):
+    """Per-table change counter, bumped in the same transaction as the change it numbers"""
+    __tablename__ = "table_versions"
+
+    table_name = Column(String(50), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
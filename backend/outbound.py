@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Priorities (lower runs first)
+PRIORITY_INTERACTIVE = 0   # a user is waiting: final STT, spoken replies, agent LLM calls
+PRIORITY_BACKGROUND = 10   # cache pre-warming, partial transcripts
+
+# Defaults shared by every provider; override per provider with OUTBOUND_<NAME>_<SETTING>
+OUTBOUND_QUEUE_TIMEOUT = float(os.getenv("OUTBOUND_QUEUE_TIMEOUT", "5"))
+OUTBOUND_MAX_QUEUE = int(os.getenv("OUTBOUND_MAX_QUEUE", "64"))
+OUTBOUND_BACKOFF_BASE = float(os.getenv("OUTBOUND_BACKOFF_BASE", "1"))
+OUTBOUND_BACKOFF_MAX = float(os.getenv("OUTBOUND_BACKOFF_MAX", "30"))
+
+class OutboundBusy(Exception):
+    """The provider's queue is full or the wait exceeded the queue timeout."""
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+def is_rate_limited(exc: Exception) -> bool:
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None) == 429 or getattr(response, "status", None) == 429
+
+class OutboundLimiter:
+    """
+    Gate for one external provider:
+    - token bucket of `rpm` requests per minute (bursts up to `burst`)
+    - at most `concurrency` requests in flight
+    - waiters served by priority, then arrival order; the queue is bounded
+    - on a 429 the provider is paused (Retry-After or exponential backoff) and its
+      rate halved, recovering gradually with each success
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rpm: float,
+        concurrency: int,
+        burst: int = None,
+        max_queue: int = OUTBOUND_MAX_QUEUE,
+        queue_timeout: float = OUTBOUND_QUEUE_TIMEOUT
+    ):
+        self.name = name
+        self.rpm = rpm
+        self.concurrency = concurrency
+        self.burst = burst or max(1, concurrency)
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._rate_factor = 1.0
+        self._backoff = OUTBOUND_BACKOFF_BASE
+        self._paused_until = 0.0
+        self._in_flight = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+        self.granted = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_INTERACTIVE):
+        """Holds one request slot for the duration of the block (streams included)."""
+        await self.acquire(priority)
+        try:
+            yield
+        except Exception as e:
+            if is_rate_limited(e):
+                self.report_rate_limited(_retry_after(e))
+            raise
+        else:
+            self.report_success()
+        finally:
+            self.release()
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE):
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise OutboundBusy(f"{self.name}: {len(self._waiters)} requests queued")
+
+        start = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not future.done():
+                future.cancel()
+                self._discard(future)
+                self.rejected += 1
+                raise OutboundBusy(f"{self.name}: no slot within {self.queue_timeout:.0f}s")
+        except asyncio.CancelledError:
+            # Caller went away: give the slot back if it was granted meanwhile
+            if future.done() and not future.cancelled():
+                self.release()
+            else:
+                future.cancel()
+                self._discard(future)
+            raise
+
+        wait_ms = (time.monotonic() - start) * 1000
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    def report_rate_limited(self, retry_after: float = None):
+        self.rate_limited += 1
+        delay = retry_after if retry_after is not None else self._backoff
+        self._backoff = min(self._backoff * 2, OUTBOUND_BACKOFF_MAX)
+        self._rate_factor = max(0.25, self._rate_factor / 2)
+        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self._tokens = 0.0
+        print(f"[OUTBOUND] {self.name} rate limited, pausing {delay:.1f}s (rate x{self._rate_factor:.2f})")
+
+    def report_success(self):
+        self._backoff = OUTBOUND_BACKOFF_BASE
+        self._rate_factor = min(1.0, self._rate_factor + 0.05)
+
+    def _refill(self, now: float):
+        rate = self.rpm * self._rate_factor / 60.0
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def _discard(self, future):
+        self._waiters = [w for w in self._waiters if w[2] is not future]
+        heapq.heapify(self._waiters)
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._refill(now)
+        while self._waiters and self._in_flight < self.concurrency:
+            if now < self._paused_until:
+                self._wake_at(self._paused_until - now)
+                return
+            if self._tokens < 1:
+                rate = self.rpm * self._rate_factor / 60.0
+                self._wake_at((1 - self._tokens) / rate)
+                return
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            self._in_flight += 1
+            self.granted += 1
+            future.set_result(True)
+
+    def _wake_at(self, delay: float):
+        if self._timer is None or self._timer.cancelled():
+            loop = asyncio.get_running_loop()
+
+            def wake():
+                self._timer = None
+                self._dispatch()
+
+            self._timer = loop.call_later(max(delay, 0.01), wake)
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._waiters),
+            "in_flight": self._in_flight,
+            "granted": self.granted,
+            "rejected": self.rejected,
+            "rate_limited": self.rate_limited,
+            "rate_factor": round(self._rate_factor, 2),
+            "paused": time.monotonic() < self._paused_until,
+            "avg_wait_ms": round(self.total_wait_ms / self.granted, 1) if self.granted else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 1),
+        }
+
+def _limiter_from_env(name: str, rpm: float, concurrency: int) -> OutboundLimiter:
+    prefix = f"OUTBOUND_{name.upper()}_"
+    return OutboundLimiter(
+        name,
+        rpm=float(os.getenv(prefix + "RPM", str(rpm))),
+        concurrency=int(os.getenv(prefix + "CONCURRENCY", str(concurrency))),
+        burst=int(os.getenv(prefix + "BURST", "0")) or None,
+    )
+
+# One limiter per provider, shared by every connection in this process
+outbound: Dict[str, OutboundLimiter] = {
+    "openai_chat": _limiter_from_env("openai_chat", rpm=500, concurrency=16),
+    "openai_stt": _limiter_from_env("openai_stt", rpm=50, concurrency=8),
+    "openai_tts": _limiter_from_env("openai_tts", rpm=50, concurrency=8),
+    "edge_tts": _limiter_from_env("edge_tts", rpm=120, concurrency=4),
+}
+
+def outbound_stats() -> dict:
+    return {name: limiter.stats() for name, limiter in outbound.items()}
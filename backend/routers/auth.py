@@ -1,73 +1,127 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from database import get_db
+from database import get_async_db
 from models import User
 from schemas import Token, UserCreate, User as UserSchema
 from auth import (
-    verify_password, 
-    get_password_hash, 
+    hash_password_async,
+    verify_and_update_async,
     create_access_token,
+    client_address,
+    login_limiter,
+    register_limiter,
+    PasswordHashBusy,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+def _request_address(request: Request) -> str:
+    return client_address(
+        request.client.host if request.client else None,
+        request.headers.get("x-forwarded-for"),
+    )
+
+def _too_many(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
+
+async def _hashing(coro):
+    """Ejecuta un hash de contraseña; con el pool saturado responde 503 en lugar de encolar"""
+    try:
+        return await coro
+    except PasswordHashBusy:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Servidor ocupado, inténtelo más tarde",
+            headers={"Retry-After": "1"},
+        )
+
 @router.post("/register", response_model=UserSchema, status_code=status.HTTP_201_CREATED)
-def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(request: Request, user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Registra un nuevo usuario"""
+    retry_after = register_limiter.hit(f"ip:{_request_address(request)}")
+    if retry_after:
+        raise _too_many("Demasiados registros desde esta dirección, inténtelo más tarde", retry_after)
+
     # Verificar si el email ya existe
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
-    if existing_user:
+    result = await db.execute(select(User).where(User.email == user_data.email))
+    if result.scalars().first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El email ya está registrado"
         )
-    
+
     # Crear nuevo usuario
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await _hashing(hash_password_async(user_data.password))
     new_user = User(
         nombre=user_data.nombre,
         email=user_data.email,
         hashed_password=hashed_password,
-        seccion=user_data.seccion
+        role=user_data.role
     )
-    
+
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    
+    await db.commit()
+    await db.refresh(new_user)
+
     return new_user
 
 @router.post("/login", response_model=Token)
-def login(
+async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Inicia sesión y devuelve un token JWT"""
+    # Solo cuentan los fallos: por dirección, y por cuenta desde esa dirección, de modo
+    # que nadie pueda bloquear una cuenta ajena equivocándose a propósito desde otro sitio
+    ip_key = f"ip:{_request_address(request)}"
+    account_key = f"email:{form_data.username.lower()}|{ip_key}"
+    retry_after = login_limiter.retry_after(ip_key, account_key)
+    if retry_after:
+        raise _too_many("Demasiados intentos de inicio de sesión, inténtelo más tarde", retry_after)
+
     # Buscar usuario por email (username en el form)
-    user = db.query(User).filter(User.email == form_data.username).first()
-    
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(User).where(User.email == form_data.username))
+    user = result.scalars().first()
+
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await _hashing(verify_and_update_async(form_data.password, user.hashed_password))
+    if not valid:
+        login_limiter.record(ip_key, account_key)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Email o contraseña incorrectos",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
+
     if not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Usuario inactivo"
         )
-    
+
+    login_limiter.reset(account_key)
+
+    # Hash creado con otro coste de bcrypt: se reemplaza ahora que tenemos la contraseña
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
+
     # Crear token
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email}, 
+        data={"sub": user.email},
         expires_delta=access_token_expires
     )
-    
+
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,19 +1,74 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Optional
+import base64
+import json
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import insert, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
 
-from database import get_db
+from database import get_async_db
 from models import Producto, User, CategoriaEnum
-from schemas import Producto as ProductoSchema, ProductoCreate, ProductoUpdate
+from schemas import Producto as ProductoSchema, ProductoCreate, ProductoUpdate, ProductoPage
 from dependencies import get_current_user
+from search import product_index, SEARCH_DEFAULT_LIMIT
+from change_feed import record_change
+from http_cache import product_version, product_pages, make_etag, not_modified, json_response
+from bulk_io import (
+    BULK_BATCH_SIZE, BULK_MAX_ERRORS, FORMATS, detect_format, parse_rows, export_rows
+)
 
 router = APIRouter(prefix="/products", tags=["Products"])
 
+# Sortable columns; id breaks ties so every key is unique
+SORT_COLUMNS = {
+    "id": Producto.id,
+    "fecha_registro": Producto.fecha_registro,
+    "nombre": Producto.nombre,
+}
+SORT_PATTERN = rf"^-?({'|'.join(SORT_COLUMNS)})$"
+
+def encode_cursor(sort: str, product: Producto) -> str:
+    value = getattr(product, sort.lstrip("-"))
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps({"sort": sort, "key": [value, product.id]})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, sort: str):
+    """Returns the (value, id) key of the last row already served."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        value, last_id = data["key"]
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if data.get("sort") != sort:
+        raise HTTPException(status_code=400, detail="El cursor no corresponde a esta ordenación")
+    if sort.lstrip("-") == "fecha_registro":
+        value = datetime.fromisoformat(value)
+    return value, last_id
+
+def keyset_query(query, sort: str, cursor: Optional[str]):
+    """Orders by (sort column, id) and resumes right after the cursor: cost does not grow with page depth."""
+    descending = sort.startswith("-")
+    column = SORT_COLUMNS[sort.lstrip("-")]
+    keys = (Producto.id,) if column is Producto.id else (column, Producto.id)
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort)
+        bound = (last_id,) if column is Producto.id else (value, last_id)
+        after = tuple_(*keys) < tuple_(*bound) if descending else tuple_(*keys) > tuple_(*bound)
+        query = query.where(after)
+
+    return query.order_by(*[k.desc() if descending else k.asc() for k in keys])
+
 @router.post("/", response_model=ProductoSchema, status_code=status.HTTP_201_CREATED)
-def create_product(
+async def create_product(
     product_data: ProductoCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Crea un nuevo producto"""
     new_product = Producto(
@@ -22,59 +77,168 @@ def create_product(
     )
     
     db.add(new_product)
-    db.commit()
-    db.refresh(new_product)
+    await db.commit()
+    await db.refresh(new_product)
     
     return new_product
 
-@router.get("/", response_model=List[ProductoSchema])
-def list_products(
-    skip: int = 0,
-    limit: int = 100,
+@router.post("/bulk")
+async def bulk_import(
+    request: Request,
+    format: Optional[str] = Query(None, pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Importa productos desde CSV (con cabecera) o NDJSON enviado en streaming.
+    Cada fila se valida contra ProductoCreate; las válidas se insertan por lotes
+    (un executemany y un commit por lote) y las inválidas se devuelven en el informe.
+    """
+    fmt = detect_format(request.headers.get("content-type"), format)
+    inserted, rejected, errors = 0, 0, []
+    batch = []
+
+    async def flush():
+        nonlocal inserted
+        if batch:
+            await db.execute(insert(Producto), batch)
+            # Core insert: no per-row deltas, clients reload the list instead
+            record_change(db.sync_session, "reload")
+            await db.commit()
+            inserted += len(batch)
+            batch.clear()
+
+    async for line, row in parse_rows(request.stream(), fmt):
+        if isinstance(row, dict):
+            try:
+                product = ProductoCreate(**row)
+            except ValidationError as e:
+                row = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            else:
+                batch.append({**product.model_dump(), "registrado_por": current_user.id})
+                if len(batch) >= BULK_BATCH_SIZE:
+                    await flush()
+                continue
+
+        rejected += 1
+        if len(errors) < BULK_MAX_ERRORS:
+            errors.append({"line": line, "error": row})
+
+    await flush()
+    # Core inserts bypass the ORM events that keep the search index fresh
+    if inserted:
+        product_index.invalidate()
+
+    return {
+        "inserted": inserted,
+        "rejected": rejected,
+        "errors": errors,
+        "errors_truncated": rejected > len(errors),
+    }
+
+@router.get("/export")
+async def export_products(
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    current_user: User = Depends(get_current_user)
+):
+    """Exporta el inventario completo en streaming (CSV o NDJSON)"""
+    return StreamingResponse(
+        export_rows(format),
+        media_type=FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="productos.{format}"'}
+    )
+
+@router.get("/", response_model=ProductoPage)
+async def list_products(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    sort: str = Query("id", pattern=SORT_PATTERN),
     categoria: Optional[str] = None,
     ubicacion: Optional[str] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Lista productos con filtros opcionales"""
-    query = db.query(Producto)
+    """
+    Lista productos con filtros opcionales, paginados por cursor.
+    sort: id, fecha_registro o nombre (prefijo '-' para descendente).
+    ubicacion filtra por prefijo (ej: "Estantería A").
+    Responde 304 si If-None-Match coincide con la versión actual de la tabla.
+    """
+    # Unchanged table: answered without querying or serializing
+    version = await product_version.current(db)
+    etag = make_etag(version)
+    response = not_modified(request, etag)
+    if response:
+        return response
+    page_key = (limit, cursor, sort, categoria, ubicacion)
+    body = product_pages.get(version, page_key)
+    if body is not None:
+        return json_response(body, etag)
+
+    query = select(Producto)
     
     if categoria:
         try:
             cat_enum = CategoriaEnum(categoria.lower())
-            query = query.filter(Producto.categoria == cat_enum)
+            query = query.where(Producto.categoria == cat_enum)
         except ValueError:
             pass # Ignore invalid category filter
             
     if ubicacion:
-        query = query.filter(Producto.ubicacion.contains(ubicacion))
+        # Range on the index instead of LIKE '%x%', which always scans the table
+        query = query.where(Producto.ubicacion >= ubicacion, Producto.ubicacion < ubicacion + "\uffff")
     
-    products = query.offset(skip).limit(limit).all()
-    return products
+    # One extra row tells whether there is a next page
+    query = keyset_query(query, sort, cursor).limit(limit + 1)
+    products = (await db.execute(query)).scalars().all()
+
+    next_cursor = encode_cursor(sort, products[limit - 1]) if len(products) > limit else None
+    page = ProductoPage.model_validate({"items": products[:limit], "next_cursor": next_cursor}, from_attributes=True)
+    body = page.model_dump_json().encode()
+    product_pages.set(version, page_key, body)
+    return json_response(body, etag)
+
+@router.get("/search")
+async def search_products(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=50),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Busca productos por nombre, ubicación o descripción (sin acentos, tolera erratas)"""
+    await product_index.refresh(db)
+    return product_index.search(q, limit)
 
 @router.get("/{product_id}", response_model=ProductoSchema)
-def get_product(
+async def get_product(
     product_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtiene un producto por ID"""
-    product = db.query(Producto).filter(Producto.id == product_id).first()
+    """Obtiene un producto por ID (304 si If-None-Match coincide)"""
+    etag = make_etag(await product_version.current(db), product_id)
+    response = not_modified(request, etag)
+    if response:
+        return response
+
+    product = await db.get(Producto, product_id)
     
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    return product
+    return json_response(ProductoSchema.model_validate(product).model_dump_json().encode(), etag)
 
 @router.put("/{product_id}", response_model=ProductoSchema)
-def update_product(
+async def update_product(
     product_id: int,
     product_update: ProductoUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualiza un producto"""
-    product = db.query(Producto).filter(Producto.id == product_id).first()
+    product = await db.get(Producto, product_id)
     
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
@@ -84,18 +248,18 @@ def update_product(
     for field, value in update_data.items():
         setattr(product, field, value)
     
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
     return product
 
 @router.delete("/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_product(
+async def delete_product(
     product_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Elimina un producto"""
-    product = db.query(Producto).filter(Producto.id == product_id).first()
+    product = await db.get(Producto, product_id)
     
     if not product:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
@@ -104,6 +268,6 @@ def delete_product(
     if product.registrado_por != current_user.id and not current_user.is_admin:
         raise HTTPException(status_code=403, detail="No autorizado")
     
-    db.delete(product)
-    db.commit()
+    await db.delete(product)
+    await db.commit()
     return None
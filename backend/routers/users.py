@@ -6,6 +6,7 @@ from database import get_db
 from models import User
 from schemas import User as UserSchema, UserUpdate
 from dependencies import get_current_user, get_current_admin_user
+from auth_cache import invalidate_user
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -57,11 +58,12 @@ def update_user(
     # Actualizar campos
     if user_update.nombre is not None:
         user.nombre = user_update.nombre
-    if user_update.seccion is not None:
-        user.seccion = user_update.seccion
+    if user_update.role is not None:
+        user.role = user_update.role
     
     db.commit()
     db.refresh(user)
+    invalidate_user(user.email)
     return user
 
 @router.delete("/{user_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -78,4 +80,5 @@ def delete_user(
     
     db.delete(user)
     db.commit()
+    invalidate_user(user.email)
     return None
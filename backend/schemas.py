@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from models import CategoriaEnum
 
 # ===== AUTH SCHEMAS =====
@@ -58,3 +58,15 @@ class Producto(ProductoBase):
     
     class Config:
         from_attributes = True
+
+class ProductoPage(BaseModel):
+    items: List[Producto]
+    # Opaque keyset cursor for the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+# ===== VOICE SCHEMAS =====
+class AudioFormat(BaseModel):
+    codec: str = "webm/opus"
+    # Microphone rates: blob uploads report the capture rate (e.g. 44100); PCM streams
+    # are further limited to the rates the VAD supports
+    sample_rate: int = Field(default=48000, ge=8000, le=48000)
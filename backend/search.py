@@ -0,0 +1,239 @@
+import asyncio
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Set
+from dotenv import load_dotenv
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from models import Producto
+
+load_dotenv()
+
+# Product search configuration
+SEARCH_INDEX_TTL = float(os.getenv("SEARCH_INDEX_TTL", "60"))
+SEARCH_MIN_SCORE = float(os.getenv("SEARCH_MIN_SCORE", "0.35"))
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "5"))
+
+# Field weights: a hit on the name counts more than one on the location or description
+FIELD_WEIGHTS = {"nombre": 1.0, "ubicacion": 0.6, "descripcion": 0.5}
+
+# Session.info key: ids of products written by the transaction, re-indexed once it commits
+_CHANGED_KEY = "search_changed_ids"
+
+# Spoken words that never identify a product
+_STOPWORDS = {
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "de", "del", "al", "a",
+    "y", "o", "en", "con", "para", "por", "que", "producto", "productos",
+}
+
+def normalize_search_text(text: str) -> str:
+    """Lowercase, accent-free, punctuation-free form used by the index."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9 ]+", " ", text)).strip()
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in normalize_search_text(text).split() if t not in _STOPWORDS]
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class _Document:
+    __slots__ = ("id", "nombre", "categoria", "ubicacion", "cantidad", "tokens")
+
+    def __init__(self, producto: Producto):
+        self.id = producto.id
+        self.nombre = producto.nombre
+        self.categoria = producto.categoria.value if producto.categoria else None
+        self.ubicacion = producto.ubicacion
+        self.cantidad = producto.cantidad
+        self.tokens = {
+            field: set(tokenize(getattr(producto, field) or ""))
+            for field in FIELD_WEIGHTS
+        }
+
+    def as_dict(self, score: float) -> Dict:
+        return {
+            "id": self.id,
+            "nombre": self.nombre,
+            "categoria": self.categoria,
+            "ubicacion": self.ubicacion,
+            "cantidad": self.cantidad,
+            "score": round(score, 3),
+        }
+
+class ProductSearchIndex:
+    """
+    In-process trigram index over Producto.nombre/ubicacion/descripcion.
+    Matching is accent-insensitive and tolerates transcription typos: each query
+    word is scored against its most similar indexed word (trigram Dice), weighted
+    by field. Products written by a committed transaction are re-read and patched
+    in on the next search; a full rebuild (off the event loop) happens after bulk
+    imports, or after SEARCH_INDEX_TTL seconds (changes made by other workers).
+    """
+
+    def __init__(self, ttl: float = SEARCH_INDEX_TTL, min_score: float = SEARCH_MIN_SCORE):
+        self.ttl = ttl
+        self.min_score = min_score
+        self._docs: Dict[int, _Document] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._grams: Dict[str, Set[str]] = {}
+        self._built_at: Optional[float] = None
+        self._dirty = True
+        self._pending: Set[int] = set()
+        self._lock = asyncio.Lock()
+        self.rebuilds = 0
+        self.updates = 0
+
+    def invalidate(self, product_ids: Optional[Iterable[int]] = None):
+        """Marks products for re-indexing; without ids the whole index is rebuilt."""
+        if product_ids is None:
+            self._dirty = True
+        else:
+            self._pending.update(product_ids)
+
+    def _stale(self) -> bool:
+        return self._dirty or self._built_at is None or time.monotonic() - self._built_at >= self.ttl
+
+    async def refresh(self, db):
+        """Brings the index up to date: a full rebuild when stale, else just the changed products."""
+        if not self._stale() and not self._pending:
+            return
+        async with self._lock:
+            if self._stale():
+                # Cleared before reading, so a commit racing the rebuild marks it dirty again
+                self._dirty = False
+                self._pending.clear()
+                productos = (await db.execute(select(Producto))).scalars().all()
+                # Tokenizing the whole catalogue is CPU-bound: keep it off the event loop
+                docs, postings, grams = await asyncio.to_thread(self._build, productos)
+                # Swapped on the loop, so a search never sees half of a new index
+                self._docs, self._postings, self._grams = docs, postings, grams
+                self._built_at = time.monotonic()
+                self.rebuilds += 1
+            elif self._pending:
+                product_ids, self._pending = self._pending, set()
+                productos = (await db.execute(select(Producto).where(Producto.id.in_(product_ids)))).scalars().all()
+                self._update(product_ids, productos)
+
+    @staticmethod
+    def _build(productos):
+        docs, postings, grams = {}, {}, {}
+        for producto in productos:
+            doc = _Document(producto)
+            docs[doc.id] = doc
+            for tokens in doc.tokens.values():
+                for token in tokens:
+                    if token not in grams:
+                        grams[token] = trigrams(token)
+                    for gram in grams[token]:
+                        postings.setdefault(gram, set()).add(doc.id)
+        return docs, postings, grams
+
+    def _update(self, product_ids: Set[int], productos):
+        """Re-indexes the given products; ids without a row left were deleted."""
+        for product_id in product_ids:
+            doc = self._docs.pop(product_id, None)
+            if doc is None:
+                continue
+            for tokens in doc.tokens.values():
+                for token in tokens:
+                    for gram in self._grams[token]:
+                        posting = self._postings.get(gram)
+                        if posting is not None:
+                            posting.discard(product_id)
+                            if not posting:
+                                del self._postings[gram]
+        for producto in productos:
+            doc = _Document(producto)
+            self._docs[doc.id] = doc
+            for tokens in doc.tokens.values():
+                for token in tokens:
+                    if token not in self._grams:
+                        self._grams[token] = trigrams(token)
+                    for gram in self._grams[token]:
+                        self._postings.setdefault(gram, set()).add(doc.id)
+        self.updates += 1
+
+    def _similarity(self, query_token: str, query_grams: Set[str], token: str) -> float:
+        if token == query_token:
+            return 1.0
+        # Partial words ("roya" -> "royal") rank just below exact ones
+        if len(query_token) >= 3 and token.startswith(query_token):
+            return 0.9
+        token_grams = self._grams[token]
+        return 2 * len(query_grams & token_grams) / (len(query_grams) + len(token_grams))
+
+    def search(self, query: str, limit: int = SEARCH_DEFAULT_LIMIT) -> List[Dict]:
+        query_tokens = tokenize(query)
+        if not query_tokens:
+            return []
+
+        query_grams = {token: trigrams(token) for token in query_tokens}
+        candidates = set()
+        for grams in query_grams.values():
+            for gram in grams:
+                candidates |= self._postings.get(gram, set())
+
+        phrase = " ".join(query_tokens)
+        ranked = []
+        for doc_id in candidates:
+            doc = self._docs[doc_id]
+            total = 0.0
+            for token in query_tokens:
+                best = 0.0
+                for field, weight in FIELD_WEIGHTS.items():
+                    for candidate in doc.tokens[field]:
+                        best = max(best, weight * self._similarity(token, query_grams[token], candidate))
+                total += best
+            score = total / len(query_tokens)
+            # Whole spoken phrase inside the name: break ties between similar products
+            if phrase in normalize_search_text(doc.nombre):
+                score = min(1.0, score + 0.1)
+            if score >= self.min_score:
+                ranked.append((score, doc))
+
+        ranked.sort(key=lambda item: (-item[0], item[1].id))
+        return [doc.as_dict(score) for score, doc in ranked[:limit]]
+
+    def stats(self) -> dict:
+        return {
+            "documents": len(self._docs),
+            "trigrams": len(self._postings),
+            "rebuilds": self.rebuilds,
+            "updates": self.updates,
+            "pending": len(self._pending),
+        }
+
+product_index = ProductSearchIndex()
+
+def mark_products_changed(session: Session, product_ids: Iterable[int]):
+    """Re-indexes these products once the session commits (for Core statements, which bypass the ORM hooks)."""
+    session.info.setdefault(_CHANGED_KEY, set()).update(product_ids)
+
+@event.listens_for(Session, "after_flush")
+def _track_product_changes(session, flush_context):
+    changed = [obj.id for obj in (*session.new, *session.dirty, *session.deleted) if isinstance(obj, Producto)]
+    if changed:
+        mark_products_changed(session, changed)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_on_commit(session):
+    # Also fired when a SAVEPOINT is released: wait for the real commit
+    if session.in_nested_transaction():
+        return
+    product_ids = session.info.pop(_CHANGED_KEY, None)
+    if product_ids:
+        # Ids from a rolled-back SAVEPOINT are kept: re-reading them is harmless
+        product_index.invalidate(product_ids)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_on_rollback(session):
+    # A failed SAVEPOINT must not forget changes already released in the outer transaction
+    if session.in_nested_transaction():
+        return
+    session.info.pop(_CHANGED_KEY, None)
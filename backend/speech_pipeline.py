@@ -0,0 +1,118 @@
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Callable, List
+
+# Pipeline configuration
+TTS_PIPELINE_CONCURRENCY = int(os.getenv("TTS_PIPELINE_CONCURRENCY", "3"))
+SENTENCE_MIN_CHARS = int(os.getenv("SENTENCE_MIN_CHARS", "20"))
+SENTENCE_MAX_CHARS = int(os.getenv("SENTENCE_MAX_CHARS", "220"))
+
+# End of sentence: punctuation followed by whitespace, or a line break
+_SENTENCE_END = re.compile(r'(?<=[.!?…:;])\s+|\n+')
+# Soft break for long runs without punctuation (e.g. inventory listings)
+_SOFT_BREAK = re.compile(r'(?<=[,;])\s+')
+
+class SentenceSplitter:
+    """Accumulates streamed LLM tokens and cuts them into speakable sentences."""
+
+    def __init__(self, min_chars: int = SENTENCE_MIN_CHARS, max_chars: int = SENTENCE_MAX_CHARS):
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        """Adds a token delta and returns the sentences completed by it."""
+        self.buffer += text
+        sentences = []
+
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            sentence, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip()
+            if sentence:
+                sentences.append(sentence)
+
+        return sentences
+
+    def flush(self) -> List[str]:
+        """Returns whatever is left once the token stream ends."""
+        rest, self.buffer = self.buffer.strip(), ""
+        return [rest] if rest else []
+
+    def _find_cut(self):
+        # Skip boundaries that would produce fragments too short to be worth a TTS call
+        for match in _SENTENCE_END.finditer(self.buffer):
+            if match.start() >= self.min_chars:
+                return match.end()
+
+        if len(self.buffer) > self.max_chars:
+            breaks = [m.end() for m in _SOFT_BREAK.finditer(self.buffer, 0, self.max_chars)]
+            return breaks[-1] if breaks else self.max_chars
+
+        return None
+
+class SpeechPipeline:
+    """
+    Overlaps LLM generation with speech synthesis.
+    Each sentence is sent to TTS as soon as it is complete; audio is yielded in
+    sentence order while later sentences are still being generated or synthesized.
+    """
+
+    def __init__(
+        self,
+        synthesize: Callable[[str], AsyncIterator[bytes]],
+        max_concurrency: int = TTS_PIPELINE_CONCURRENCY
+    ):
+        self.synthesize = synthesize
+        self.max_concurrency = max_concurrency
+
+    async def stream(self, tokens: AsyncIterator[str]) -> AsyncIterator[bytes]:
+        """Consumes LLM token deltas and yields audio chunks in order."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        order: asyncio.Queue = asyncio.Queue()
+        tasks = []
+
+        async def synthesize_sentence(sentence: str, out: asyncio.Queue):
+            try:
+                async for chunk in self.synthesize(sentence):
+                    await out.put(chunk)
+            finally:
+                semaphore.release()
+                out.put_nowait(None)
+
+        async def schedule(sentence: str):
+            await semaphore.acquire()
+            out = asyncio.Queue()
+            tasks.append(asyncio.create_task(synthesize_sentence(sentence, out)))
+            await order.put(out)
+
+        async def produce():
+            splitter = SentenceSplitter()
+            try:
+                async for token in tokens:
+                    for sentence in splitter.feed(token):
+                        await schedule(sentence)
+                for sentence in splitter.flush():
+                    await schedule(sentence)
+            finally:
+                order.put_nowait(None)
+
+        producer = asyncio.create_task(produce())
+        try:
+            while True:
+                out = await order.get()
+                if out is None:
+                    break
+                while True:
+                    chunk = await out.get()
+                    if chunk is None:
+                        break
+                    yield chunk
+            # Surface errors raised while consuming the token stream
+            await producer
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
@@ -0,0 +1,136 @@
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Local Whisper configuration
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_WORKERS = int(os.getenv("WHISPER_WORKERS", "1"))
+WHISPER_QUEUE_SIZE = int(os.getenv("WHISPER_QUEUE_SIZE", "4"))
+WHISPER_QUEUE_TIMEOUT = float(os.getenv("WHISPER_QUEUE_TIMEOUT", "2"))
+WHISPER_PRELOAD = os.getenv("WHISPER_PRELOAD", "true").lower() in ("1", "true", "yes")
+WHISPER_START_METHOD = os.getenv("WHISPER_START_METHOD", "spawn")
+WHISPER_LANGUAGE = "es"
+
+# ===== WORKER PROCESS SIDE =====
+
+# Model loaded once per worker process by the pool initializer
+_worker_model = None
+
+def _init_worker(model_size: str):
+    global _worker_model
+    import whisper
+    print(f"[STT] Worker {os.getpid()} loading whisper model '{model_size}'...")
+    _worker_model = whisper.load_model(model_size)
+
+def _warmup() -> int:
+    return os.getpid()
+
+def _transcribe(audio_bytes: bytes, language: str) -> str:
+    from audio_codec import decode_audio
+
+    # Decoded in memory: no temp files on the hot path
+    audio = decode_audio(audio_bytes)
+    result = _worker_model.transcribe(audio, language=language)
+    return result["text"]
+
+# ===== EVENT LOOP SIDE =====
+
+class STTQueueFull(Exception):
+    """Raised when the local STT queue is saturated (backpressure)."""
+
+class WhisperPool:
+    """
+    Pool of worker processes with a warm Whisper model each.
+    Inference runs off the event loop; at most `queue_size` transcriptions
+    may be running or waiting at any time.
+    """
+
+    def __init__(
+        self,
+        model_size: str = WHISPER_MODEL,
+        workers: int = WHISPER_WORKERS,
+        queue_size: int = WHISPER_QUEUE_SIZE,
+        queue_timeout: float = WHISPER_QUEUE_TIMEOUT
+    ):
+        self.model_size = model_size
+        self.workers = workers
+        self.queue_size = max(queue_size, workers)
+        self.queue_timeout = queue_timeout
+        self.available = importlib.util.find_spec("whisper") is not None
+        self._executor = None
+        # Bumped on every restart: a crash report only restarts the pool it came from
+        self._generation = 0
+        self._slots = asyncio.Semaphore(self.queue_size)
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Transcriptions currently running or queued."""
+        return self._pending
+
+    def start(self):
+        if not self.available:
+            print("[STT] openai-whisper not installed, local fallback disabled.")
+            return
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(WHISPER_START_METHOD),
+                initializer=_init_worker,
+                initargs=(self.model_size,)
+            )
+
+    async def preload(self):
+        """Starts every worker so the model is loaded before the first request."""
+        self.start()
+        if not self._executor:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            pids = await asyncio.gather(
+                *[loop.run_in_executor(self._executor, _warmup) for _ in range(self.workers)]
+            )
+        except Exception as e:
+            print(f"[STT] Whisper preload failed: {e}")
+            return
+        print(f"[STT] Whisper pool ready ({len(set(pids))} workers, model '{self.model_size}')")
+
+    async def transcribe(self, audio_bytes: bytes, language: str = WHISPER_LANGUAGE) -> str:
+        if not self.available:
+            raise RuntimeError("openai-whisper is not installed")
+        self.start()
+
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise STTQueueFull(f"Local STT queue full ({self.queue_size} pending)")
+
+        self._pending += 1
+        generation = self._generation
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, _transcribe, audio_bytes, language)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM); replace the pool so later requests can recover.
+            # Every request in flight on the broken pool fails together: only the first
+            # one restarts it, the others must not shut down its replacement
+            if generation == self._generation:
+                print("[STT] Whisper worker crashed, restarting pool.")
+                self.shutdown()
+                self.start()
+            raise
+        finally:
+            self._pending -= 1
+            self._slots.release()
+
+    def shutdown(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._generation += 1
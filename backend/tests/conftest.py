@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# Modules read the database configuration at import time: point it at a scratch file
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def session_factory(tmp_path):
+    """Sync sessions on a fresh SQLite file, configured like the app's engines."""
+    from database import Base, _configure_sqlite
+    engine = create_engine(f"sqlite:///{tmp_path}/app.db")
+    _configure_sqlite(engine)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autoflush=False)
+    engine.dispose()
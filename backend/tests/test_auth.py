@@ -0,0 +1,29 @@
+from auth import LoginRateLimiter, client_address, issue_session_id, verify_session_id, TRUSTED_PROXIES
+
+def test_only_recorded_attempts_count():
+    limiter = LoginRateLimiter(max_attempts=2, window=60)
+    for _ in range(5):
+        assert limiter.retry_after("ip:a") == 0
+    limiter.record("ip:a", "email:x|ip:a")
+    limiter.record("ip:a", "email:x|ip:a")
+    assert limiter.retry_after("ip:a") > 0
+    # The same account from another address is not locked out
+    assert limiter.retry_after("ip:b", "email:x|ip:b") == 0
+
+def test_forwarded_for_only_from_trusted_proxy(monkeypatch):
+    monkeypatch.setattr("auth.TRUSTED_PROXIES", TRUSTED_PROXIES | {"10.0.0.1"})
+    assert client_address("10.0.0.1", "1.2.3.4, 10.0.0.1") == "1.2.3.4"
+    assert client_address("10.0.0.1", "6.6.6.6, 1.2.3.4") == "1.2.3.4"
+    assert client_address("9.9.9.9", "1.2.3.4") == "9.9.9.9"
+
+def test_session_id_is_bound_to_its_user():
+    session_id = issue_session_id("ana@t.com")
+    thread_id = verify_session_id(session_id, "ana@t.com")
+    assert thread_id and session_id.startswith(thread_id)
+    assert verify_session_id(session_id, "otro@t.com") is None
+    assert verify_session_id(thread_id, "ana@t.com") is None
+    # A forged thread id under a valid signature, or a tampered signature
+    signature = session_id.rpartition(".")[2]
+    assert verify_session_id(f"otro-hilo.{signature}", "ana@t.com") is None
+    assert verify_session_id(session_id[:-1] + ("A" if session_id[-1] != "A" else "B"), "ana@t.com") is None
+    assert verify_session_id(None) is None
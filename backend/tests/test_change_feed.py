@@ -0,0 +1,69 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+import change_feed
+from models import CategoriaEnum, Producto, TableVersion
+
+@pytest.fixture
+def published(monkeypatch):
+    payloads = []
+    monkeypatch.setattr(change_feed.inventory_feed, "publish", payloads.append)
+    return payloads
+
+def _producto(**kwargs):
+    return Producto(categoria=CategoriaEnum.OTROS, ubicacion="A1", **kwargs)
+
+def test_failed_savepoint_keeps_released_changes(session_factory, published):
+    with session_factory() as db:
+        with db.begin_nested():
+            db.add(_producto(id=1, nombre="Collar"))
+        with pytest.raises(IntegrityError):
+            with db.begin_nested():
+                db.add(_producto(id=1, nombre="Duplicado"))
+                db.flush()
+        db.commit()
+
+        assert db.execute(select(TableVersion.version)).scalar() == 1
+
+    assert len(published) == 1
+    assert published[0]["version"] == 1
+    assert [(c["op"], c["id"]) for c in published[0]["changes"]] == [("created", 1)]
+
+def test_rolled_back_savepoint_changes_are_not_published(session_factory, published):
+    with session_factory() as db:
+        with db.begin_nested():
+            db.add(_producto(id=1, nombre="Collar"))
+        with pytest.raises(ValueError):
+            with db.begin_nested():
+                db.add(_producto(id=2, nombre="Pelota"))
+                db.flush()
+                raise ValueError("tool failed")
+        db.commit()
+
+    assert [c["id"] for c in published[0]["changes"]] == [1]
+
+def test_outer_rollback_publishes_nothing(session_factory, published):
+    with session_factory() as db:
+        with db.begin_nested():
+            db.add(_producto(id=1, nombre="Collar"))
+        db.rollback()
+        db.commit()
+
+    assert published == []
+
+def test_version_bumps_even_when_deltas_are_dropped(session_factory, published):
+    with session_factory() as db:
+        db.add(_producto(id=1, nombre="Collar"))
+        db.commit()
+        with pytest.raises(ValueError):
+            with db.begin_nested():
+                db.get(Producto, 1).cantidad = 5
+                db.flush()
+                raise ValueError("tool failed")
+        db.commit()
+
+        assert db.execute(select(TableVersion.version)).scalar() == 2
+
+    assert [p["version"] for p in published] == [1, 2]
+    assert published[1]["changes"] == []
@@ -0,0 +1,12 @@
+import pytest
+from pydantic import ValidationError
+
+from schemas import AudioFormat
+
+@pytest.mark.parametrize("sample_rate", [0, 1, 33, 7999, 48001, 10**9])
+def test_audio_format_rejects_unusable_sample_rates(sample_rate):
+    with pytest.raises(ValidationError):
+        AudioFormat(codec="pcm/s16le", sample_rate=sample_rate)
+
+def test_audio_format_accepts_capture_rates():
+    assert AudioFormat(sample_rate=44100).sample_rate == 44100
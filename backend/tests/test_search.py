@@ -0,0 +1,33 @@
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+import search
+from models import CategoriaEnum, Producto
+
+def test_failed_savepoint_still_invalidates_index(session_factory, monkeypatch):
+    invalidations = []
+    monkeypatch.setattr(search.product_index, "invalidate", lambda ids=None: invalidations.append(ids))
+    with session_factory() as db:
+        with db.begin_nested():
+            db.add(Producto(id=1, nombre="Collar", categoria=CategoriaEnum.OTROS, ubicacion="A1"))
+        with pytest.raises(IntegrityError):
+            with db.begin_nested():
+                db.add(Producto(id=1, nombre="Duplicado", categoria=CategoriaEnum.OTROS, ubicacion="A1"))
+                db.flush()
+        db.commit()
+
+    assert invalidations == [{1}]
+
+def test_changed_products_are_patched_into_the_index():
+    index = search.ProductSearchIndex()
+    docs, index._postings, index._grams = index._build([
+        Producto(id=1, nombre="Collar rojo", categoria=CategoriaEnum.OTROS, ubicacion="A1", cantidad=3),
+        Producto(id=2, nombre="Pelota", categoria=CategoriaEnum.JUGUETES, ubicacion="B2", cantidad=5),
+    ])
+    index._docs = docs
+
+    index._update({1, 2}, [Producto(id=1, nombre="Arnes azul", categoria=CategoriaEnum.OTROS, ubicacion="A1", cantidad=3)])
+
+    assert [hit["id"] for hit in index.search("arnes")] == [1]
+    assert index.search("collar") == []
+    assert index.search("pelota") == []
@@ -0,0 +1,36 @@
+import asyncio
+from concurrent.futures.process import BrokenProcessPool
+
+import stt_pool
+from stt_pool import WhisperPool
+
+class _BrokenExecutor:
+    """Stands in for a process pool whose worker died: every submitted job fails."""
+
+    def __init__(self, started):
+        started.append(self)
+
+    def submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        loop.call_later(0.01, future.set_exception, BrokenProcessPool("worker died"))
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+def test_concurrent_crashes_restart_the_pool_once(monkeypatch):
+    started = []
+    monkeypatch.setattr(stt_pool, "ProcessPoolExecutor", lambda **kwargs: _BrokenExecutor(started))
+
+    async def scenario():
+        pool = WhisperPool(workers=2)
+        pool.available = True
+        loop = asyncio.get_running_loop()
+        monkeypatch.setattr(loop, "run_in_executor", lambda executor, fn, *args: executor.submit(fn, *args))
+        results = await asyncio.gather(*[pool.transcribe(b"audio") for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(result, BrokenProcessPool) for result in results)
+
+    asyncio.run(scenario())
+    # The first pool, plus a single replacement
+    assert len(started) == 2
@@ -0,0 +1,34 @@
+import asyncio
+
+from turns import TurnScheduler, TurnCancelled
+
+def test_turn_from_another_connection_supersedes_the_thread_turn():
+    async def scenario():
+        cancelled = []
+
+        async def on_cancelled(key, turn_id, reason):
+            cancelled.append((key, reason))
+
+        scheduler = TurnScheduler(on_cancelled)
+        first = asyncio.create_task(scheduler.run("thread", lambda: asyncio.sleep(5), owner="sid-a"))
+        await asyncio.sleep(0.01)
+        second = await scheduler.run("thread", lambda: asyncio.sleep(0, "done"), owner="sid-b")
+        try:
+            await first
+        except TurnCancelled:
+            pass
+        else:
+            raise AssertionError("the first turn should have been superseded")
+        return second, cancelled
+
+    assert asyncio.run(scenario()) == ("done", [("thread", "superseded")])
+
+def test_disconnect_spares_another_connections_turn():
+    async def scenario():
+        scheduler = TurnScheduler()
+        turn = asyncio.create_task(scheduler.run("thread", lambda: asyncio.sleep(0.05, "done"), owner="sid-b"))
+        await asyncio.sleep(0.01)
+        spared = not await scheduler.cancel("thread", "disconnected", owner="sid-a")
+        return spared, await turn
+
+    assert asyncio.run(scenario()) == (True, "done")
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select, update
+
+from database import AsyncSessionLocal, Base, engine
+from models import CategoriaEnum, Producto
+from unit_of_work import UOW_CONFIG_KEY, TurnConflict, TurnUnitOfWork, run_tool
+
+@pytest.fixture(autouse=True)
+def fresh_tables():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+async def _stock():
+    async with AsyncSessionLocal() as db:
+        return dict((await db.execute(select(Producto.nombre, Producto.cantidad).order_by(Producto.id))).all())
+
+async def _create(db, nombre="Collar", cantidad=1):
+    producto = Producto(nombre=nombre, categoria=CategoriaEnum.OTROS, ubicacion="A1", cantidad=cantidad)
+    db.add(producto)
+    await db.flush()
+    return f"created {producto.id}"
+
+async def _restock(db):
+    producto = (await db.execute(select(Producto).where(Producto.nombre == "Collar"))).scalar_one()
+    producto.cantidad += 5
+    return f"stock {producto.cantidad}"
+
+def test_turn_writes_are_committed_together_at_the_end():
+    async def turn():
+        uow = TurnUnitOfWork()
+        config = {"configurable": {UOW_CONFIG_KEY: uow}}
+        try:
+            assert await run_tool(config, _create) == "created 1"
+            # Later calls see the turn's writes; other sessions do not until it commits
+            assert await run_tool(config, _restock) == "stock 6"
+            assert await _stock() == {}
+            await uow.commit()
+        finally:
+            await uow.close()
+        return await _stock()
+
+    assert asyncio.run(turn()) == {"Collar": 6}
+
+def test_failed_turn_leaves_no_writes():
+    async def turn():
+        uow = TurnUnitOfWork()
+        config = {"configurable": {UOW_CONFIG_KEY: uow}}
+        try:
+            await run_tool(config, _create)
+            with pytest.raises(ValueError):
+                async def failing(db):
+                    await _create(db, "Pelota")
+                    raise ValueError("tool failed")
+                await run_tool(config, failing)
+            # The turn fails after its first tool call (e.g. the LLM request errors): no commit
+        finally:
+            await uow.close()
+        return await _stock()
+
+    assert asyncio.run(turn()) == {}
+
+def test_conflicting_change_aborts_the_whole_turn():
+    async def turn():
+        async with AsyncSessionLocal() as db:
+            await _create(db)
+            await db.commit()
+
+        uow = TurnUnitOfWork()
+        config = {"configurable": {UOW_CONFIG_KEY: uow}}
+        try:
+            await run_tool(config, lambda db: _create(db, "Pelota"))
+            assert await run_tool(config, _restock) == "stock 6"
+            # Another client sells the collar before the turn commits
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Producto).where(Producto.nombre == "Collar").values(cantidad=0))
+                await db.commit()
+            with pytest.raises(TurnConflict):
+                await uow.commit()
+        finally:
+            await uow.close()
+        return await _stock()
+
+    assert asyncio.run(turn()) == {"Collar": 0}
+
+def test_direct_calls_commit_on_their_own():
+    async def call():
+        assert await run_tool(None, _create) == "created 1"
+        return await _stock()
+
+    assert asyncio.run(call()) == {"Collar": 1}
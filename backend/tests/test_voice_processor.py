@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+from outbound import OutboundBusy, PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE
+from voice_processor import VoiceProcessor
+
+def _processor(error):
+    async def create(**kwargs):
+        raise error
+
+    async def stt_local(audio_bytes):
+        processor.local_calls += 1
+        return "local"
+
+    processor = VoiceProcessor()
+    processor.client = SimpleNamespace(audio=SimpleNamespace(transcriptions=SimpleNamespace(create=create)))
+    processor.local_calls = 0
+    processor.stt_local = stt_local
+    return processor
+
+def test_background_transcript_is_dropped_when_provider_is_busy():
+    processor = _processor(OutboundBusy("queue full"))
+    assert asyncio.run(processor.stt(b"audio", priority=PRIORITY_BACKGROUND)) == ""
+    assert processor.local_calls == 0
+
+def test_interactive_transcript_falls_back_to_local_whisper():
+    processor = _processor(OutboundBusy("queue full"))
+    assert asyncio.run(processor.stt(b"audio", priority=PRIORITY_INTERACTIVE)) == "local"
+    assert processor.local_calls == 1
+
+def _tts_processor():
+    processor = VoiceProcessor()
+    processor.client = object()
+    processor.tts_cache.disk_dir = None
+
+    async def synthesize(provider, text, priority):
+        yield f"{provider}-audio".encode()
+
+    processor._tts_provider_stream = synthesize
+    asyncio.run(processor.tts_cache.put(processor._tts_cache_key("edge", "hola"), b"edge-cached"))
+    return processor
+
+def test_tts_cache_of_a_fallback_voice_is_not_used_while_openai_is_healthy():
+    processor = _tts_processor()
+    assert asyncio.run(processor.tts("hola")) == b"openai-audio"
+    assert processor.tts_cache.misses == 1
+
+def test_tts_cache_of_the_fallback_voice_is_used_when_openai_is_out():
+    processor = _tts_processor()
+    processor.breakers["openai"]._open()
+    assert asyncio.run(processor.tts("hola")) == b"edge-cached"
+    assert processor.tts_cache.misses == 0
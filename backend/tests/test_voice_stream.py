@@ -0,0 +1,26 @@
+import pytest
+
+from voice_stream import VoiceStreamSession, PARTIAL_TRANSCRIPT_WINDOW_MS
+
+def test_partial_audio_is_bounded_to_the_trailing_window():
+    session = VoiceStreamSession(16000)
+    window = 16000 * PARTIAL_TRANSCRIPT_WINDOW_MS // 1000 * 2
+    session._speech.extend(b"\x01\x00" * (window // 2))
+    assert len(session.partial_audio()) == window and not session.partial_truncated
+
+    session._speech.extend(b"\x02\x00" * 16000)
+    pcm = session.partial_audio()
+    assert len(pcm) == window and session.partial_truncated
+    assert pcm.endswith(b"\x02\x00" * 16000)
+
+@pytest.mark.parametrize("sample_rate", [10, 44100, 10**9])
+def test_unsupported_sample_rates_are_rejected(sample_rate):
+    with pytest.raises(ValueError):
+        VoiceStreamSession(sample_rate)
+
+def test_stream_buffers_at_most_one_partial_frame():
+    session = VoiceStreamSession(16000)
+    for _ in range(3):
+        session.feed(b"\x00" * (1024 * 1024 + 1))
+    assert len(session._remainder) < session.frame_bytes
+    assert len(session._speech) == 0
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import os
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# TTS cache configuration
+TTS_CACHE_MAX_ENTRIES = int(os.getenv("TTS_CACHE_MAX_ENTRIES", "512"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+TTS_CACHE_MAX_TEXT_CHARS = int(os.getenv("TTS_CACHE_MAX_TEXT_CHARS", "160"))
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")
+
+# Phrases the system itself says verbatim; synthesized once at startup
+STATIC_PHRASES = [
+    "No entendí eso.",
+    "Lo siento, encontré un error.",
+    "Error: OpenAI API Key missing.",
+]
+STATIC_PHRASES += [p.strip() for p in os.getenv("TTS_PREWARM_PHRASES", "").split("|") if p.strip()]
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys (Unicode NFC, collapsed whitespace)."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio.
+    Keys hash (provider, voice, model, normalized text). Entries live in a
+    bounded in-memory LRU, with an optional directory as a second tier.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TTS_CACHE_MAX_ENTRIES,
+        max_bytes: int = TTS_CACHE_MAX_BYTES,
+        max_text_chars: int = TTS_CACHE_MAX_TEXT_CHARS,
+        disk_dir: str = TTS_CACHE_DIR
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_text_chars = max_text_chars
+        self.disk_dir = disk_dir or None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(provider: str, voice: str, model: str, text: str) -> str:
+        raw = "\x1f".join([provider, voice, model, normalize_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def cacheable(self, text: str) -> bool:
+        """Only short phrases are cached; long answers are streamed and never held whole."""
+        return 0 < len(normalize_text(text)) <= self.max_text_chars
+
+    async def get(self, key: str) -> Optional[bytes]:
+        audio = self._entries.get(key)
+        if audio is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+        if self.disk_dir:
+            audio = await asyncio.to_thread(self._read_disk, key)
+            if audio:
+                self.disk_hits += 1
+                self._remember(key, audio)
+                return audio
+
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, audio: bytes):
+        if not audio:
+            return
+        self._remember(key, audio)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, audio)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+        }
+
+    def _remember(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous)
+        self._entries[key] = audio
+        self._bytes += len(audio)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+            self.evictions += 1
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.mp3")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _write_disk(self, key: str, audio: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so concurrent readers never see a partial file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, Optional
+
+class TurnCancelled(Exception):
+    """Raised to callers whose turn was superseded or cancelled before it finished."""
+
+class TurnScheduler:
+    """
+    One conversational turn at a time per conversation thread, whichever connection
+    it comes from. A new turn supersedes the one in flight (barge-in): the old task is cancelled,
+    which stops its LLM call, tools and pending TTS, and the new turn only starts
+    once the old one has fully unwound, so turns never overlap on a thread.
+    """
+
+    def __init__(self, on_cancelled: Callable[[str, int, str], Awaitable[None]] = None):
+        self.on_cancelled = on_cancelled
+        self._turns: Dict[str, asyncio.Task] = {}
+        # Held for the whole turn, so turns on one thread never overlap
+        self._locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._ids = itertools.count(1)
+        self.started = 0
+        self.cancelled = 0
+
+    def active(self, key: str) -> Optional[asyncio.Task]:
+        task = self._turns.get(key)
+        return task if task and not task.done() else None
+
+    async def run(self, key: str, turn: Callable[[], Awaitable], reason: str = "superseded", owner: str = None):
+        """
+        Runs turn() as the current turn for `key` and returns its result.
+        `owner` (the connection that asked for it) lets cancel() spare other connections' turns.
+        Raises TurnCancelled if a later turn (or cancel()) interrupts it.
+        """
+        previous = self.active(key)
+        turn_id = next(self._ids)
+
+        if previous:
+            self._cancel_task(previous, reason)
+
+        async def runner():
+            # A superseded turn releases the lock only once it has unwound
+            async with self._locks[key]:
+                try:
+                    return await turn()
+                except asyncio.CancelledError:
+                    # Still holding the lock: the next turn starts after this cleanup
+                    self.cancelled += 1
+                    if self.on_cancelled:
+                        await self.on_cancelled(key, turn_id, getattr(task, "cancel_reason", "cancelled"))
+                    raise
+
+        task = asyncio.create_task(runner())
+        task.turn_id = turn_id
+        task.owner = owner
+        self._turns[key] = task
+        self.started += 1
+        try:
+            # wait() instead of awaiting the task: cancelling it must not cancel the caller
+            await asyncio.wait({task})
+        except asyncio.CancelledError:
+            # The caller itself went away: do not leave its turn running orphaned
+            task.cancel()
+            raise
+        finally:
+            if self._turns.get(key) is task:
+                del self._turns[key]
+                # An older turn may still be unwinding with the lock held
+                if not self._locks[key].locked():
+                    del self._locks[key]
+
+        if task.cancelled():
+            raise TurnCancelled(f"turn {turn_id} cancelled")
+        return task.result()
+
+    async def cancel(self, key: str, reason: str = "cancelled", owner: str = None) -> bool:
+        """
+        Cancels the turn in flight for `key` (explicit cancel_turn or disconnect).
+        With `owner`, only a turn started by that connection is cancelled.
+        """
+        task = self.active(key)
+        if not task or (owner is not None and task.owner != owner):
+            return False
+        self._cancel_task(task, reason)
+        await asyncio.wait({task})
+        return True
+
+    @staticmethod
+    def _cancel_task(task: asyncio.Task, reason: str):
+        task.cancel_reason = reason
+        task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "active": sum(1 for task in self._turns.values() if not task.done()),
+            "started": self.started,
+            "cancelled": self.cancelled,
+        }
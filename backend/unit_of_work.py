@@ -0,0 +1,136 @@
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple
+from langchain_core.runnables import RunnableConfig
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+
+# Key under config["configurable"] where the agent passes the turn's unit of work
+UOW_CONFIG_KEY = "unit_of_work"
+
+# Session.info counter of write statements and flushes that wrote something
+_WRITES_KEY = "unit_of_work_writes"
+
+# A tool call's database work: runs against a session and returns the tool result
+ToolWork = Callable[[AsyncSession], Awaitable[str]]
+
+class TurnConflict(Exception):
+    """The rows a turn wrote were changed by someone else before the turn committed."""
+
+class TurnUnitOfWork:
+    """
+    Writes of one agent turn, committed together when the turn ends and discarded
+    if it fails or is cancelled.
+    Each tool call runs in a short transaction that replays the turn's earlier writes,
+    so it sees them, and is then rolled back: no lock is held across LLM round trips.
+    Calls that wrote are recorded, and commit() replays them all in one transaction.
+    A replay that no longer gives the result the model was shown (another client
+    changed those rows meanwhile) aborts the whole turn with TurnConflict.
+    """
+
+    def __init__(self):
+        self._session: Optional[AsyncSession] = None
+        self._writes: List[Tuple[ToolWork, str]] = []
+        # ToolNode runs parallel tool calls concurrently; a session is not concurrency-safe
+        self._lock = asyncio.Lock()
+
+    @property
+    def has_writes(self) -> bool:
+        return bool(self._writes)
+
+    def _db(self) -> AsyncSession:
+        if self._session is None:
+            self._session = AsyncSessionLocal()
+        return self._session
+
+    async def run(self, work: ToolWork) -> str:
+        """Runs a tool call on top of the turn's pending writes and returns its result."""
+        async with self._lock:
+            db = self._db()
+            try:
+                await self._replay(db)
+                writes_before = db.sync_session.info.get(_WRITES_KEY, 0)
+                result = await _execute(db, work)
+                wrote = db.sync_session.info.get(_WRITES_KEY, 0) > writes_before
+            finally:
+                await self._end(db, commit=False)
+            if wrote:
+                self._writes.append((work, result))
+            return result
+
+    async def commit(self):
+        """Applies the turn's writes in one short transaction."""
+        async with self._lock:
+            if not self._writes:
+                return
+            db = self._db()
+            try:
+                await self._replay(db)
+            except BaseException:
+                await self._end(db, commit=False)
+                raise
+            await self._end(db, commit=True)
+            self._writes.clear()
+
+    async def _replay(self, db: AsyncSession):
+        for work, expected in self._writes:
+            try:
+                result = await _execute(db, work)
+            except Exception as e:
+                raise TurnConflict(str(e)) from e
+            if result != expected:
+                raise TurnConflict(f"resultado distinto al repetir la operación: {result}")
+
+    @staticmethod
+    async def _end(db: AsyncSession, commit: bool):
+        try:
+            if commit:
+                await db.commit()
+            else:
+                await db.rollback()
+        finally:
+            # The next call must not see rows cached before other clients' commits
+            db.expunge_all()
+            db.sync_session.info.pop(_WRITES_KEY, None)
+
+    async def close(self):
+        """Releases the session at the end of the turn; uncommitted writes are dropped."""
+        self._writes.clear()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+async def _execute(db: AsyncSession, work: ToolWork) -> str:
+    result = await work(db)
+    # Pending ORM changes are written now, so they count as writes of this call
+    await db.flush()
+    return result
+
+async def run_tool(config: Optional[RunnableConfig], work: ToolWork) -> str:
+    """
+    Runs a tool call's database work: inside the turn's unit of work when the agent
+    provides one, otherwise (direct calls, fast path) in a session of its own that
+    commits when the work succeeds.
+    """
+    uow = ((config or {}).get("configurable") or {}).get(UOW_CONFIG_KEY)
+    if uow is not None:
+        return await uow.run(work)
+
+    async with AsyncSessionLocal() as db:
+        result = await work(db)
+        await db.commit()
+        return result
+
+@event.listens_for(Session, "after_flush")
+def _count_flushed_writes(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info[_WRITES_KEY] = session.info.get(_WRITES_KEY, 0) + 1
+
+@event.listens_for(Session, "do_orm_execute")
+def _count_statement_writes(orm_execute_state):
+    # Core-style INSERT/UPDATE/DELETE (bulk insert, atomic stock UPDATE) bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        info = orm_execute_state.session.info
+        info[_WRITES_KEY] = info.get(_WRITES_KEY, 0) + 1
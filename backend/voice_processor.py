@@ -1,93 +1,210 @@
 import os
-import tempfile
 import base64
 import asyncio
 from openai import AsyncOpenAI
 import edge_tts
+from audio_codec import as_upload, pcm_to_wav
+from stt_pool import WhisperPool, STTQueueFull, WHISPER_PRELOAD
+from tts_cache import TTSCache, STATIC_PHRASES
+from outbound import outbound, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND, OutboundBusy, is_rate_limited
+from circuit_breaker import CircuitBreaker, CircuitOpen, with_first_chunk_timeout
+from typing import AsyncIterator
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# TTS configuration
+OPENAI_TTS_MODEL = os.getenv("OPENAI_TTS_MODEL", "tts-1")
+OPENAI_TTS_VOICE = os.getenv("OPENAI_TTS_VOICE", "nova")
+EDGE_TTS_VOICE = os.getenv("EDGE_TTS_VOICE", "es-ES-AlvaroNeural")
+TTS_STREAM_CHUNK_SIZE = int(os.getenv("TTS_STREAM_CHUNK_SIZE", "4096"))
+
+# Provider timeouts: a hung provider must fail fast so the fallback can answer
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "15"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+TTS_FIRST_CHUNK_TIMEOUT = float(os.getenv("TTS_FIRST_CHUNK_TIMEOUT", "5"))
+
 class VoiceProcessor:
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
-        self.client = AsyncOpenAI(api_key=self.api_key) if self.api_key else None
+        self.client = AsyncOpenAI(
+            api_key=self.api_key,
+            timeout=OPENAI_TIMEOUT,
+            max_retries=OPENAI_MAX_RETRIES
+        ) if self.api_key else None
+
+        # Open circuits route straight to the fallback engine
+        self.breakers = {
+            "openai": CircuitBreaker("openai", probe=self._probe_openai if self.client else None),
+            "edge": CircuitBreaker("edge"),
+        }
         
-        # Lazy load whisper only if needed to save startup time
-        self.local_whisper_model = None
+        # Local Whisper runs in a process pool so inference never blocks the event loop
+        self.whisper_pool = WhisperPool()
+        self._background_tasks = set()
+
+        # Repeated phrases skip the provider round trip
+        self.tts_cache = TTSCache()
+
+    async def start(self, prewarm_phrases=None):
+        """Starts background engines (called on app startup)."""
+        # Warm up in the background so startup is not delayed
+        if WHISPER_PRELOAD:
+            self._run_in_background(self.whisper_pool.preload())
+        self._run_in_background(self.prewarm(STATIC_PHRASES + list(prewarm_phrases or [])))
+
+    def _run_in_background(self, coro):
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
 
-    async def stt(self, audio_bytes: bytes) -> str:
+    def shutdown(self):
+        self.whisper_pool.shutdown()
+        for breaker in self.breakers.values():
+            breaker.stop()
+
+    async def _probe_openai(self):
+        """Cheap health check used while the OpenAI circuit is open."""
+        await self.client.models.retrieve("whisper-1")
+
+    async def stt(self, audio_bytes: bytes, filename: str = "audio.webm", priority: int = PRIORITY_INTERACTIVE) -> str:
         """Converts audio to text using OpenAI Whisper with Local Fallback."""
         if not self.client: 
             print("STT: No API Key, forcing local Whisper.")
             return await self.stt_local(audio_bytes)
         
-        with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp:
-            temp.write(audio_bytes)
-            temp_path = temp.name
-            
         try:
-            # Try API First
-            with open(temp_path, "rb") as audio_file:
-                transcript = await self.client.audio.transcriptions.create(
-                    model="whisper-1", 
-                    file=audio_file,
-                    language="es"
-                )
+            # Try API First (uploaded straight from memory); queued behind the shared rate limit
+            async with self.breakers["openai"].guard():
+                async with outbound["openai_stt"].slot(priority):
+                    transcript = await self.client.audio.transcriptions.create(
+                        model="whisper-1", 
+                        file=as_upload(audio_bytes, filename),
+                        language="es"
+                    )
             return transcript.text
         except Exception as e:
-            print(f"STT API Error: {e}. Falling back to Local Whisper...")
-            return await self.stt_local(audio_bytes, temp_path)
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-
-    async def stt_local(self, audio_bytes: bytes, temp_path: str = None) -> str:
-        """Local Whisper fallback."""
+            if priority != PRIORITY_INTERACTIVE:
+                # Background transcripts (partials) are dropped rather than competing
+                # with final transcripts for the local Whisper pool
+                if not isinstance(e, (CircuitOpen, OutboundBusy)) and not is_rate_limited(e):
+                    print(f"STT API Error (background, dropped): {e}")
+                return ""
+            if not isinstance(e, CircuitOpen):
+                print(f"STT API Error: {e}. Falling back to Local Whisper...")
+            return await self.stt_local(audio_bytes)
+
+    async def stt_pcm(self, pcm: bytes, sample_rate: int, priority: int = PRIORITY_INTERACTIVE) -> str:
+        """Transcribes raw mono 16-bit PCM (from voice_chunk streams)."""
+        return await self.stt(pcm_to_wav(pcm, sample_rate), "audio.wav", priority)
+
+    async def stt_local(self, audio_bytes: bytes) -> str:
+        """Local Whisper fallback (process pool, off the event loop)."""
         try:
-            import whisper
-            
-            if not temp_path:
-                with tempfile.NamedTemporaryFile(suffix=".webm", delete=False) as temp:
-                    temp.write(audio_bytes)
-                    temp_path = temp.name
-            
-            # Lazy load model (using 'base' as it's fast)
-            if not self.local_whisper_model:
-                print("Loading local whisper model 'base'...")
-                self.local_whisper_model = whisper.load_model("base")
-            
-            result = self.local_whisper_model.transcribe(temp_path, language="es")
-            return result["text"]
+            return await self.whisper_pool.transcribe(audio_bytes)
+        except STTQueueFull as busy:
+            print(f"Local STT busy: {busy}")
+            return ""
         except Exception as local_e:
             print(f"Local STT Error: {local_e}")
             return ""
-        finally:
-            if not temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
 
-    async def tts(self, text: str) -> bytes:
+    async def tts(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> bytes:
         """Converts text to audio using OpenAI (High Quality) or Edge-TTS (Fallback)."""
-        if self.client:
+        chunks = [chunk async for chunk in self.tts_stream(text, priority)]
+        return b"".join(chunks)
+
+    async def tts_stream(self, text: str, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[bytes]:
+        """
+        Streams MP3 audio chunks as the provider yields them.
+        Short phrases are served from the cache of the provider that would synthesize them.
+        Falls back to Edge-TTS only if OpenAI fails before the first chunk;
+        a failure mid-stream ends the stream (the client already started playing).
+        """
+        providers = ["openai", "edge"] if self.client else ["edge"]
+        cacheable = self.tts_cache.cacheable(text)
+
+        for provider in providers:
+            # Skipped before the cache lookup: a cached Edge voice is only used once OpenAI is out
+            if not self.breakers[provider].available():
+                continue
+            if cacheable:
+                audio = await self.tts_cache.get(self._tts_cache_key(provider, text))
+                if audio:
+                    yield audio
+                    return
+
+            chunks = []
+            started = False
             try:
-                # Use OpenAI TTS
-                response = await self.client.audio.speech.create(
-                    model="tts-1",
-                    voice="nova",
-                    input=text
-                )
-                return response.content
+                async for chunk in self._tts_provider_stream(provider, text, priority):
+                    started = True
+                    if cacheable:
+                        chunks.append(chunk)
+                    yield chunk
             except Exception as e:
-                print(f"OpenAI TTS Failed, falling back to Edge: {e}")
-        
-        # Fallback to Edge TTS (Free, decent quality)
-        try:
-            communicate = edge_tts.Communicate(text, "es-ES-AlvaroNeural")
-            audio_data = b""
+                if started:
+                    print(f"{provider} TTS stream interrupted: {e}")
+                    return
+                if isinstance(e, CircuitOpen):
+                    continue
+                if provider == "openai":
+                    print(f"OpenAI TTS Failed, falling back to Edge: {e}")
+                else:
+                    print(f"Edge TTS Failed: {e}")
+                continue
+
+            if chunks:
+                await self.tts_cache.put(self._tts_cache_key(provider, text), b"".join(chunks))
+            return
+
+    async def _tts_provider_stream(self, provider: str, text: str, priority: int) -> AsyncIterator[bytes]:
+        limiter = outbound["openai_tts" if provider == "openai" else "edge_tts"]
+        async with self.breakers[provider].guard():
+            # The slot is held until the stream ends (it bounds concurrent syntheses).
+            # The first-chunk timer starts only once it is held: waiting behind our
+            # own load is not a provider failure
+            async with limiter.slot(priority):
+                async for chunk in with_first_chunk_timeout(
+                    self._tts_request(provider, text), TTS_FIRST_CHUNK_TIMEOUT
+                ):
+                    yield chunk
+
+    async def _tts_request(self, provider: str, text: str) -> AsyncIterator[bytes]:
+        if provider == "openai":
+            async with self.client.audio.speech.with_streaming_response.create(
+                model=OPENAI_TTS_MODEL,
+                voice=OPENAI_TTS_VOICE,
+                input=text,
+                response_format="mp3"
+            ) as response:
+                async for chunk in response.iter_bytes(TTS_STREAM_CHUNK_SIZE):
+                    yield chunk
+        else:
+            # Edge TTS (Free, decent quality)
+            communicate = edge_tts.Communicate(text, EDGE_TTS_VOICE)
             async for chunk in communicate.stream():
                 if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
-            return audio_data
-        except Exception as e:
-            print(f"Edge TTS Failed: {e}")
-            return b""
+                    yield chunk["data"]
+
+    def _tts_cache_key(self, provider: str, text: str) -> str:
+        if provider == "openai":
+            return self.tts_cache.make_key(provider, OPENAI_TTS_VOICE, OPENAI_TTS_MODEL, text)
+        return self.tts_cache.make_key(provider, EDGE_TTS_VOICE, "edge-tts", text)
+
+    async def prewarm(self, phrases):
+        """Synthesizes known static phrases into the TTS cache."""
+        warmed = 0
+        for phrase in phrases:
+            if not self.tts_cache.cacheable(phrase):
+                continue
+            audio = await self.tts(phrase, PRIORITY_BACKGROUND)
+            warmed += 1 if audio else 0
+        print(f"[TTS] Cache pre-warmed with {warmed}/{len(phrases)} phrases")
+
+    def stats(self) -> dict:
+        return {
+            "tts_cache": self.tts_cache.stats(),
+            "stt_pool": {"pending": self.whisper_pool.pending, "workers": self.whisper_pool.workers},
+            "breakers": {name: breaker.stats() for name, breaker in self.breakers.items()},
+        }
@@ -0,0 +1,151 @@
+import os
+from collections import deque
+from typing import List
+import numpy as np
+from dotenv import load_dotenv
+
+try:
+    import webrtcvad
+except ImportError:  # Optional: falls back to an energy detector
+    webrtcvad = None
+
+load_dotenv()
+
+# VAD / endpointing configuration
+VAD_FRAME_MS = 30
+VAD_MODE = int(os.getenv("VAD_MODE", "2"))
+VAD_ENERGY_THRESHOLD = float(os.getenv("VAD_ENERGY_THRESHOLD", "500"))
+VAD_START_FRAMES = int(os.getenv("VAD_START_FRAMES", "3"))
+VAD_PREROLL_MS = int(os.getenv("VAD_PREROLL_MS", "300"))
+VAD_HANGOVER_MS = int(os.getenv("VAD_HANGOVER_MS", "200"))
+VAD_ENDPOINT_SILENCE_MS = int(os.getenv("VAD_ENDPOINT_SILENCE_MS", "700"))
+VAD_MAX_UTTERANCE_MS = int(os.getenv("VAD_MAX_UTTERANCE_MS", "30000"))
+PARTIAL_TRANSCRIPT_INTERVAL_MS = int(os.getenv("PARTIAL_TRANSCRIPT_INTERVAL_MS", "1200"))
+# Partials transcribe only the trailing speech, so each upload stays small however long the utterance
+PARTIAL_TRANSCRIPT_WINDOW_MS = int(os.getenv("PARTIAL_TRANSCRIPT_WINDOW_MS", "4000"))
+
+# PCM rates accepted for microphone streams (the rates WebRTC VAD supports)
+VAD_SAMPLE_RATES = (8000, 16000, 32000, 48000)
+
+# Events returned by VoiceStreamSession.feed
+SPEECH_START = "speech_start"
+ENDPOINT = "endpoint"
+
+class VoiceActivityDetector:
+    """Frame classifier: WebRTC VAD when available, RMS energy otherwise."""
+
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.vad = None
+        if webrtcvad and sample_rate in (8000, 16000, 32000, 48000):
+            self.vad = webrtcvad.Vad(VAD_MODE)
+
+    def is_speech(self, frame: bytes) -> bool:
+        if self.vad:
+            return self.vad.is_speech(frame, self.sample_rate)
+        samples = np.frombuffer(frame, dtype=np.int16).astype(np.float32)
+        return float(np.sqrt(np.mean(samples ** 2))) >= VAD_ENERGY_THRESHOLD
+
+class VoiceStreamSession:
+    """
+    Per-client microphone stream (one per Socket.IO sid).
+    Buffers PCM frames, keeps only speech (plus a short pre-roll and hangover)
+    and detects the end of the utterance from trailing silence.
+    """
+
+    def __init__(self, sample_rate: int, context: dict = None, stream: bool = True):
+        if sample_rate not in VAD_SAMPLE_RATES:
+            raise ValueError(f"Unsupported sample rate {sample_rate} (use one of {VAD_SAMPLE_RATES})")
+        self.sample_rate = sample_rate
+        self.context = context or {}
+        self.stream = stream
+        self.vad = VoiceActivityDetector(sample_rate)
+
+        self.frame_bytes = int(sample_rate * VAD_FRAME_MS / 1000) * 2
+        self._remainder = b""
+        self._preroll = deque(maxlen=max(VAD_PREROLL_MS // VAD_FRAME_MS, 1))
+        self._speech = bytearray()
+        self._voiced_run = 0
+        self._silence_ms = 0
+        self._last_partial_bytes = 0
+
+        self.in_speech = False
+        self.ended = False
+        self.partial_task = None
+
+    @property
+    def speech_ms(self) -> int:
+        return len(self._speech) * 1000 // (self.sample_rate * 2)
+
+    def feed(self, pcm: bytes) -> List[str]:
+        """Consumes a PCM chunk and returns the VAD events it triggered."""
+        # Nothing is buffered once the utterance ended; otherwise at most one partial
+        # frame is carried over, and speech is capped by VAD_MAX_UTTERANCE_MS
+        if self.ended:
+            return []
+        events = []
+        data = self._remainder + pcm
+        usable = len(data) - len(data) % self.frame_bytes
+        self._remainder = data[usable:]
+
+        for offset in range(0, usable, self.frame_bytes):
+            if self.ended:
+                break
+            frame = data[offset:offset + self.frame_bytes]
+            event = self._process_frame(frame, self.vad.is_speech(frame))
+            if event:
+                events.append(event)
+
+        return events
+
+    def _process_frame(self, frame: bytes, voiced: bool):
+        if not self.in_speech:
+            self._preroll.append(frame)
+            self._voiced_run = self._voiced_run + 1 if voiced else 0
+            if self._voiced_run >= VAD_START_FRAMES:
+                self.in_speech = True
+                self._speech.extend(b"".join(self._preroll))
+                self._preroll.clear()
+                return SPEECH_START
+            return None
+
+        self._speech.extend(frame)
+        self._silence_ms = 0 if voiced else self._silence_ms + VAD_FRAME_MS
+
+        if self._silence_ms >= VAD_ENDPOINT_SILENCE_MS or self.speech_ms >= VAD_MAX_UTTERANCE_MS:
+            self.ended = True
+            return ENDPOINT
+        return None
+
+    def wants_partial(self) -> bool:
+        """True when enough new speech arrived since the last partial transcript."""
+        if not self.in_speech or self.ended or PARTIAL_TRANSCRIPT_INTERVAL_MS <= 0:
+            return False
+        if self.partial_task and not self.partial_task.done():
+            return False
+        new_ms = (len(self._speech) - self._last_partial_bytes) * 1000 // (self.sample_rate * 2)
+        return new_ms >= PARTIAL_TRANSCRIPT_INTERVAL_MS
+
+    def partial_audio(self) -> bytes:
+        """The last PARTIAL_TRANSCRIPT_WINDOW_MS of speech (see partial_truncated)."""
+        self._last_partial_bytes = len(self._speech)
+        return bytes(self._speech[-self._partial_window_bytes():])
+
+    @property
+    def partial_truncated(self) -> bool:
+        """True when partial_audio() no longer covers the start of the utterance."""
+        return len(self._speech) > self._partial_window_bytes()
+
+    def _partial_window_bytes(self) -> int:
+        return int(self.sample_rate * PARTIAL_TRANSCRIPT_WINDOW_MS / 1000) * 2
+
+    def utterance(self) -> bytes:
+        """Speech audio with trailing silence trimmed down to the hangover."""
+        trailing = max(self._silence_ms - VAD_HANGOVER_MS, 0)
+        trim = int(self.sample_rate * trailing / 1000) * 2
+        return bytes(self._speech[:len(self._speech) - trim])
+
+    def close(self):
+        self.ended = True
+        if self.partial_task and not self.partial_task.done():
+            self.partial_task.cancel()
@@ -1,15 +1,43 @@
 import React, { useState } from 'react';
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import { useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { productsAPI } from '../api/client';
 import { useInteractionStore } from '../stores/interactionStore';
 import { Plus, Trash2, Edit2, Package, MapPin, Filter } from 'lucide-react';
 import { Modal, Button, Form } from 'react-bootstrap';
 
 const CATEGORIAS = ['alimentacion', 'juguetes', 'accesorios', 'salud', 'higiene', 'otros'];
+const ORDENES = [
+    { value: 'id', label: 'Más antiguos' },
+    { value: '-fecha_registro', label: 'Más recientes' },
+    { value: 'nombre', label: 'Nombre (A-Z)' },
+    { value: '-nombre', label: 'Nombre (Z-A)' },
+];
+const PAGE_SIZE = 48;
+// Fields that can move a product to another page or filter: a patch is not enough
+const LAYOUT_FIELDS = ['nombre', 'categoria', 'fecha_registro'];
+
+// Applies inventory_delta changes to the cached pages of one products query
+const patchPages = (data, changes) => {
+    if (!data) return data;
+    const byId = new Map(changes.map(change => [change.id, change]));
+    return {
+        ...data,
+        pages: data.pages.map(page => ({
+            ...page,
+            items: page.items
+                .filter(item => byId.get(item.id)?.op !== 'deleted')
+                .map(item => {
+                    const change = byId.get(item.id);
+                    return change?.op === 'updated' ? { ...item, ...change.fields } : item;
+                }),
+        })),
+    };
+};
 
 const ProductsManager = () => {
     const queryClient = useQueryClient();
     const [filterCategory, setFilterCategory] = useState('');
+    const [sort, setSort] = useState('id');
     const [showModal, setShowModal] = useState(false);
     const [editingProduct, setEditingProduct] = useState(null);
 
@@ -23,19 +51,58 @@ const ProductsManager = () => {
     });
 
     // Queries
-    const { data: products, isLoading, isError } = useQuery({
-        queryKey: ['products', filterCategory],
-        queryFn: () => productsAPI.list(filterCategory ? { categoria: filterCategory } : {}).then(res => res.data),
+    // Keyset pagination: each page resumes from the cursor returned by the previous one
+    const { data, isLoading, isError, fetchNextPage, hasNextPage, isFetchingNextPage } = useInfiniteQuery({
+        queryKey: ['products', filterCategory, sort],
+        queryFn: ({ pageParam }) => productsAPI.list({
+            limit: PAGE_SIZE,
+            sort,
+            ...(filterCategory ? { categoria: filterCategory } : {}),
+            ...(pageParam ? { cursor: pageParam } : {}),
+        }).then(res => res.data),
+        initialPageParam: null,
+        getNextPageParam: (lastPage) => lastPage.next_cursor ?? undefined,
     });
+    const products = data?.pages.flatMap(page => page.items);
 
     // Interaction Store for Voice Form Filling
     const { formData: agentFormData } = useInteractionStore();
 
     // Real-time Updates & Event Listeners
+    const inventoryVersion = React.useRef(null);
     React.useEffect(() => {
-        const handleUpdates = () => {
-            queryClient.invalidateQueries(['products']);
-            console.log('🔄 Actualizando lista de productos...');
+        let refetchTimer = null;
+        // Bulk imports send one delta per batch: coalesce the refetches
+        const scheduleRefetch = () => {
+            clearTimeout(refetchTimer);
+            refetchTimer = setTimeout(() => {
+                queryClient.invalidateQueries({ queryKey: ['products'] });
+                console.log('🔄 Actualizando lista de productos...');
+            }, 300);
+        };
+
+        // Patch cached pages in place; refetch only when a patch cannot be trusted
+        const handleDelta = (event) => {
+            const { version, changes, resync } = event.detail;
+            if (resync) {
+                inventoryVersion.current = null;
+                scheduleRefetch();
+                return;
+            }
+            const last = inventoryVersion.current;
+            if (last !== null && version <= last) return;
+            inventoryVersion.current = version;
+
+            const missedChanges = last !== null && version !== last + 1;
+            const needsRefetch = changes.some(change =>
+                change.op === 'created' || change.op === 'reload' ||
+                (change.op === 'updated' && Object.keys(change.fields || {}).some(f => LAYOUT_FIELDS.includes(f)))
+            );
+            if (missedChanges || needsRefetch) {
+                scheduleRefetch();
+                return;
+            }
+            queryClient.setQueriesData({ queryKey: ['products'] }, data => patchPages(data, changes));
         };
 
         const handleOpenForm = () => {
@@ -48,13 +115,14 @@ const ProductsManager = () => {
             console.log('❌ Cerrando formulario por voz...');
         };
 
-        // Escuchar eventos tanto de productos como los genéricos antiguos por si acaso
-        window.addEventListener('products_updated', handleUpdates);
+        // Cambios de inventario (change feed) y formulario por voz
+        window.addEventListener('inventory_delta', handleDelta);
         window.addEventListener('open_product_form', handleOpenForm);
         window.addEventListener('close_product_form', handleCloseForm);
 
         return () => {
-            window.removeEventListener('products_updated', handleUpdates);
+            clearTimeout(refetchTimer);
+            window.removeEventListener('inventory_delta', handleDelta);
             window.removeEventListener('open_product_form', handleOpenForm);
             window.removeEventListener('close_product_form', handleCloseForm);
         };
@@ -75,23 +143,17 @@ const ProductsManager = () => {
     // Mutations
     const createMutation = useMutation({
         mutationFn: productsAPI.create,
-        onSuccess: () => {
-            queryClient.invalidateQueries(['products']);
-            handleClose();
-        }
+        // The list is refreshed by the inventory_delta broadcast of this change
+        onSuccess: () => handleClose()
     });
 
     const updateMutation = useMutation({
         mutationFn: ({ id, data }) => productsAPI.update(id, data),
-        onSuccess: () => {
-            queryClient.invalidateQueries(['products']);
-            handleClose();
-        }
+        onSuccess: () => handleClose()
     });
 
     const deleteMutation = useMutation({
         mutationFn: productsAPI.delete,
-        onSuccess: () => queryClient.invalidateQueries(['products']),
     });
 
     // Handlers
@@ -169,6 +231,17 @@ const ProductsManager = () => {
                         <option key={c} value={c}>{c.charAt(0).toUpperCase() + c.slice(1)}</option>
                     ))}
                 </select>
+                <span className="fw-semibold small text-muted text-uppercase ms-3">Ordenar:</span>
+                <select
+                    className="form-select border-0 bg-transparent fw-semibold text-primary w-auto"
+                    value={sort}
+                    onChange={(e) => setSort(e.target.value)}
+                    style={{ minWidth: '150px' }}
+                >
+                    {ORDENES.map(o => (
+                        <option key={o.value} value={o.value}>{o.label}</option>
+                    ))}
+                </select>
             </div>
 
             {isLoading && (
@@ -231,6 +304,18 @@ const ProductsManager = () => {
                 ))}
             </div>
 
+            {hasNextPage && (
+                <div className="text-center mt-4">
+                    <button
+                        className="btn btn-outline-primary rounded-pill px-4"
+                        onClick={() => fetchNextPage()}
+                        disabled={isFetchingNextPage}
+                    >
+                        {isFetchingNextPage ? 'Cargando...' : 'Cargar más'}
+                    </button>
+                </div>
+            )}
+
             {products?.length === 0 && (
                 <div className="text-center py-5 text-muted">
                     <Package size={48} className="mb-3 opacity-25" />
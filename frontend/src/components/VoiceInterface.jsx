@@ -4,13 +4,14 @@ import { useInteractionStore } from '../stores/interactionStore';
 import { useAudio } from '../hooks/useAudio';
 
 const VoiceInterface = () => {
-    const { isRecording, isConnected } = useInteractionStore();
+    const { isRecording, isConnected, partialTranscript } = useInteractionStore();
     const { startRecording, stopRecording } = useAudio();
 
     // Keyboard Shortcuts
     React.useEffect(() => {
         const handleKeyDown = (e) => {
-            if (e.key === 'ArrowDown' && isConnected && !isRecording) {
+            // Ignore key auto-repeat so a server-side endpoint doesn't restart recording
+            if (e.key === 'ArrowDown' && !e.repeat && isConnected && !isRecording) {
                 e.preventDefault();
                 startRecording();
             }
@@ -100,6 +101,13 @@ const VoiceInterface = () => {
                 (or press <kbd style={{ fontSize: '1.2em', padding: '0.1rem 0.5rem', verticalAlign: 'middle' }}>↓</kbd>)
             </p>
 
+            {/* Live partial transcript from the server */}
+            {partialTranscript && (
+                <p className="text-muted fst-italic text-center small mb-0" style={{ maxWidth: '320px' }}>
+                    {partialTranscript}
+                </p>
+            )}
+
             {/* Voice Waves when Recording */}
             {isRecording && (
                 <div className="d-flex align-items-center gap-1" style={{ height: '30px' }}>
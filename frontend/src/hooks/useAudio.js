@@ -1,24 +1,165 @@
 import { useEffect, useRef } from 'react';
 import io from 'socket.io-client';
 import { useInteractionStore } from '../stores/interactionStore';
+import { useAuthStore } from '../stores/authStore';
 
 const SOCKET_URL = 'http://localhost:8001'; // Adjust if needed
 
+// Conversation id issued (and signed) by the backend in connection_ack; sent back on
+// every (re)connect so the same agent thread is resumed for the same user
+const getSessionId = () => localStorage.getItem('voice_session_id');
+
+// Upper bound checked before upload (mirrors the backend MAX_AUDIO_BYTES)
+const MAX_AUDIO_BYTES = 5 * 1024 * 1024;
+
+// Live microphone streams send raw 16-bit PCM; the backend does VAD/endpointing
+const STREAM_SAMPLE_RATE = 16000;
+const STREAM_BUFFER_SIZE = 2048;
+
+const floatToPcm16 = (input) => {
+    const pcm = new Int16Array(input.length);
+    for (let i = 0; i < input.length; i++) {
+        const s = Math.max(-1, Math.min(1, input[i]));
+        pcm[i] = s < 0 ? s * 0x8000 : s * 0x7fff;
+    }
+    return pcm;
+};
+
+// 'audio/webm;codecs=opus' -> 'webm/opus' (the codec header expected by voice_input)
+const describeCodec = (mimeType) => {
+    const [type, params = ''] = (mimeType || 'audio/webm').split(';');
+    const container = type.split('/')[1] || 'webm';
+    const codec = (params.match(/codecs="?([a-z0-9]+)/i) || [])[1];
+    const defaults = { webm: 'opus', ogg: 'opus', mp4: 'aac', mpeg: 'mp3', wav: 'pcm' };
+    return `${container}/${(codec || defaults[container] || 'opus').toLowerCase()}`;
+};
+
+// Plays MP3 chunks as they arrive (MediaSource), reordering by sequence number.
+// Falls back to buffering the whole clip when MediaSource can't handle audio/mpeg.
+const createStreamPlayer = () => {
+    const pending = new Map();
+    let nextSeq = 0;
+    let finalSeq = null;
+
+    if (!(window.MediaSource && MediaSource.isTypeSupported('audio/mpeg'))) {
+        const parts = [];
+        return {
+            push: (seq, bytes, final) => {
+                pending.set(seq, { bytes, final });
+                while (pending.has(nextSeq)) {
+                    const item = pending.get(nextSeq);
+                    pending.delete(nextSeq);
+                    nextSeq += 1;
+                    if (item.final) {
+                        const url = URL.createObjectURL(new Blob(parts, { type: 'audio/mpeg' }));
+                        new Audio(url).play();
+                    } else {
+                        parts.push(item.bytes);
+                    }
+                }
+            },
+            stop: () => { parts.length = 0; }
+        };
+    }
+
+    const mediaSource = new MediaSource();
+    const audioPlayer = new Audio(URL.createObjectURL(mediaSource));
+    const queue = [];
+    let sourceBuffer = null;
+    let started = false;
+
+    const pump = () => {
+        if (!sourceBuffer || sourceBuffer.updating) return;
+        if (queue.length > 0) {
+            sourceBuffer.appendBuffer(queue.shift());
+        } else if (finalSeq !== null && nextSeq > finalSeq && mediaSource.readyState === 'open') {
+            mediaSource.endOfStream();
+        }
+    };
+
+    mediaSource.addEventListener('sourceopen', () => {
+        sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+        sourceBuffer.addEventListener('updateend', pump);
+        pump();
+    });
+
+    return {
+        push: (seq, bytes, final) => {
+            pending.set(seq, { bytes, final });
+            while (pending.has(nextSeq)) {
+                const item = pending.get(nextSeq);
+                pending.delete(nextSeq);
+                if (item.final) {
+                    finalSeq = nextSeq;
+                } else {
+                    queue.push(item.bytes);
+                }
+                nextSeq += 1;
+            }
+            pump();
+            // Start playback as soon as the first chunk is buffered
+            if (!started && bytes) {
+                started = true;
+                audioPlayer.play().catch(() => { });
+            }
+        },
+        stop: () => {
+            audioPlayer.pause();
+            queue.length = 0;
+        }
+    };
+};
+
 export const useAudio = () => {
     const socketRef = useRef(null);
     const mediaRecorderRef = useRef(null);
     const audioChunksRef = useRef([]);
+    const streamPlayerRef = useRef(null);
+    const replyAudioRef = useRef(null);
+    const captureRef = useRef(null);
 
     const {
         setConnected,
         addMessage,
         updateField,
-        setRecording
+        setRecording,
+        setPartialTranscript
     } = useInteractionStore();
 
+    const releaseCapture = () => {
+        const capture = captureRef.current;
+        if (!capture) return false;
+        captureRef.current = null;
+        capture.processor.onaudioprocess = null;
+        capture.source.disconnect();
+        capture.processor.disconnect();
+        capture.stream.getTracks().forEach(track => track.stop());
+        capture.audioContext.close();
+        return true;
+    };
+
+    // Silences whatever the agent is saying (cancelled turn or barge-in)
+    const stopPlayback = () => {
+        if (streamPlayerRef.current) {
+            streamPlayerRef.current.stop();
+            streamPlayerRef.current = null;
+        }
+        if (replyAudioRef.current) {
+            replyAudioRef.current.pause();
+            replyAudioRef.current = null;
+        }
+    };
+
     useEffect(() => {
         // Initialize Socket
-        socketRef.current = io(SOCKET_URL);
+        // auth as a callback: reconnects send the latest session id and token
+        socketRef.current = io(SOCKET_URL, {
+            auth: (cb) => cb({ session_id: getSessionId(), token: useAuthStore.getState().token })
+        });
+
+        socketRef.current.on('connection_ack', ({ session_id }) => {
+            localStorage.setItem('voice_session_id', session_id);
+        });
 
         socketRef.current.on('connect', () => {
             console.log('Connected to backend');
@@ -30,9 +171,47 @@ export const useAudio = () => {
             setConnected(false);
         });
 
+        // Live microphone stream: partial transcripts and server-side endpointing
+        socketRef.current.on('partial_transcript', (data) => {
+            // Long utterances: only the trailing seconds are transcribed
+            setPartialTranscript(data.truncated ? `… ${data.text}` : data.text);
+        });
+
+        socketRef.current.on('voice_stream_endpoint', () => {
+            releaseCapture();
+            setRecording(false);
+        });
+
+        // Committed product changes from any client, REST or voice (see ProductsManager)
+        socketRef.current.on('inventory_delta', (data) => {
+            window.dispatchEvent(new CustomEvent('inventory_delta', { detail: data }));
+        });
+        // Deltas sent while disconnected are lost: ask listeners to resync
+        socketRef.current.io.on('reconnect', () => {
+            window.dispatchEvent(new CustomEvent('inventory_delta', { detail: { resync: true } }));
+        });
+
+        // The server stopped a turn (superseded by a newer one, or cancel_turn)
+        socketRef.current.on('turn_cancelled', () => {
+            stopPlayback();
+            setPartialTranscript('');
+        });
+
+        // Handle streamed TTS audio (voice_input with stream: true)
+        socketRef.current.on('voice_audio_chunk', (data) => {
+            const { seq, audio, final } = data;
+            if (seq === 0 || !streamPlayerRef.current) {
+                if (streamPlayerRef.current) streamPlayerRef.current.stop();
+                streamPlayerRef.current = createStreamPlayer();
+            }
+            streamPlayerRef.current.push(seq, audio, final);
+            if (final) streamPlayerRef.current = null;
+        });
+
         // Handle Voice Response
         socketRef.current.on('voice_response', (data) => {
             const { text, audio, user_text, actions } = data;
+            setPartialTranscript('');
 
             // Add user text to chat
             if (user_text) {
@@ -43,8 +222,10 @@ export const useAudio = () => {
 
             // Play Audio
             if (audio) {
-                const audioSrc = `data:audio/mp3;base64,${audio}`;
+                const audioSrc = URL.createObjectURL(new Blob([audio], { type: 'audio/mpeg' }));
                 const audioPlayer = new Audio(audioSrc);
+                audioPlayer.onended = () => URL.revokeObjectURL(audioSrc);
+                replyAudioRef.current = audioPlayer;
                 audioPlayer.play();
             }
 
@@ -55,9 +236,6 @@ export const useAudio = () => {
                         updateField(action.field, action.value);
                     } else if (action.action === 'submit_form') {
                         alert('Form Submitted successfully!');
-                    } else if (['producto_created', 'product_updated', 'product_deleted', 'material_created', 'material_updated', 'material_deleted'].includes(action.action)) {
-                        // Dispatch global event for listeners (like ProductsManager)
-                        window.dispatchEvent(new CustomEvent('products_updated'));
                     } else if (action.action === 'open_product_form' || action.action === 'open_material_form') {
                         window.dispatchEvent(new CustomEvent('open_product_form'));
                     } else if (action.action === 'close_product_form' || action.action === 'close_material_form') {
@@ -82,8 +260,6 @@ export const useAudio = () => {
                         updateField(action.field, action.value);
                     } else if (action.action === 'submit_form') {
                         alert('Form Submitted successfully!');
-                    } else if (['producto_created', 'product_updated', 'product_deleted', 'material_created', 'material_updated', 'material_deleted'].includes(action.action)) {
-                        window.dispatchEvent(new CustomEvent('products_updated'));
                     } else if (action.action === 'open_product_form' || action.action === 'open_material_form') {
                         window.dispatchEvent(new CustomEvent('open_product_form'));
                     } else if (action.action === 'close_product_form' || action.action === 'close_material_form') {
@@ -102,27 +278,88 @@ export const useAudio = () => {
         };
     }, []);
 
-    const startRecording = async () => {
-        try {
-            const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
-            mediaRecorderRef.current = new MediaRecorder(stream);
-            audioChunksRef.current = [];
+    // Inventory deltas only reach authenticated sockets: reconnect when the token changes
+    const token = useAuthStore((state) => state.token);
+    useEffect(() => {
+        const socket = socketRef.current;
+        if (!socket || !socket.connected) return;
+        socket.disconnect().connect();
+        window.dispatchEvent(new CustomEvent('inventory_delta', { detail: { resync: true } }));
+    }, [token]);
 
-            mediaRecorderRef.current.ondataavailable = (event) => {
-                if (event.data.size > 0) {
-                    audioChunksRef.current.push(event.data);
-                }
-            };
+    // Fallback for browsers without Web Audio: record a whole clip and send it on release
+    const startClipRecording = async () => {
+        const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+        mediaRecorderRef.current = new MediaRecorder(stream);
+        audioChunksRef.current = [];
 
-            mediaRecorderRef.current.onstop = () => {
-                const audioBlob = new Blob(audioChunksRef.current, { type: 'audio/webm' });
-                // Emit to backend
-                if (socketRef.current) {
-                    socketRef.current.emit('voice_input', { audio: audioBlob, context: {} });
-                }
-            };
+        mediaRecorderRef.current.ondataavailable = (event) => {
+            if (event.data.size > 0) {
+                audioChunksRef.current.push(event.data);
+            }
+        };
+
+        const mimeType = mediaRecorderRef.current.mimeType || 'audio/webm';
+        const sampleRate = stream.getAudioTracks()[0]?.getSettings().sampleRate || 48000;
+
+        mediaRecorderRef.current.onstop = async () => {
+            stream.getTracks().forEach(track => track.stop());
+            const audioBlob = new Blob(audioChunksRef.current, { type: mimeType });
+            if (audioBlob.size > MAX_AUDIO_BYTES) {
+                alert('Recording too long.');
+                return;
+            }
+            // Emit to backend as a binary attachment with its codec header
+            if (socketRef.current) {
+                socketRef.current.emit('voice_input', {
+                    audio: await audioBlob.arrayBuffer(),
+                    format: { codec: describeCodec(mimeType), sample_rate: sampleRate },
+                    context: {},
+                    stream: true
+                });
+            }
+        };
+
+        mediaRecorderRef.current.start();
+    };
+
+    // Streams PCM frames while the user talks (voice_stream_start / voice_chunk / voice_stream_end)
+    const startStreamRecording = async () => {
+        const stream = await navigator.mediaDevices.getUserMedia({
+            audio: { channelCount: 1, echoCancellation: true, noiseSuppression: true }
+        });
+        const audioContext = new AudioContext({ sampleRate: STREAM_SAMPLE_RATE });
+        const source = audioContext.createMediaStreamSource(stream);
+        const processor = audioContext.createScriptProcessor(STREAM_BUFFER_SIZE, 1, 1);
+
+        socketRef.current.emit('voice_stream_start', {
+            format: { codec: 'pcm/s16le', sample_rate: audioContext.sampleRate },
+            context: {},
+            stream: true
+        });
+
+        processor.onaudioprocess = (event) => {
+            const pcm = floatToPcm16(event.inputBuffer.getChannelData(0));
+            socketRef.current.emit('voice_chunk', { audio: pcm.buffer });
+        };
+
+        source.connect(processor);
+        processor.connect(audioContext.destination);
+        captureRef.current = { stream, audioContext, source, processor };
+    };
 
-            mediaRecorderRef.current.start();
+    const startRecording = async () => {
+        if (!socketRef.current || captureRef.current) return;
+        // Barge-in: talking over the agent stops its reply and the turn behind it
+        stopPlayback();
+        socketRef.current.emit('cancel_turn');
+        try {
+            setPartialTranscript('');
+            if (window.AudioContext) {
+                await startStreamRecording();
+            } else {
+                await startClipRecording();
+            }
             setRecording(true);
         } catch (err) {
             console.error("Error accessing microphone:", err);
@@ -131,7 +368,10 @@ export const useAudio = () => {
     };
 
     const stopRecording = () => {
-        if (mediaRecorderRef.current && mediaRecorderRef.current.state === 'recording') {
+        if (releaseCapture()) {
+            socketRef.current.emit('voice_stream_end');
+            setRecording(false);
+        } else if (mediaRecorderRef.current && mediaRecorderRef.current.state === 'recording') {
             mediaRecorderRef.current.stop();
             setRecording(false);
         }
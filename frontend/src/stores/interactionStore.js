@@ -23,4 +23,6 @@ export const useInteractionStore = create((set) => ({
     // Voice State
     isRecording: false,
     setRecording: (status) => set({ isRecording: status }),
+    partialTranscript: '',
+    setPartialTranscript: (text) => set({ partialTranscript: text }),
 }));